@@ -0,0 +1,350 @@
+"""
+Пакетная генерация этикеток для каталога товаров herself19
+
+Читает CSV или JSONL построчно (каталог целиком в память не загружается).
+Поля строки:
+
+- composition - состав, например "95% Хлопок, 5% Эластан"
+- care_type   - washable / not_washable (или "стирать можно" / "стирать нельзя")
+- sizes       - размеры через ";" или ",", пусто / "all" - все размеры
+- colors      - white / black (или белый / чёрный), пусто / "all" - оба цвета
+- quantity    - количество каждой этикетки (для режима --imposed)
+
+Пример:
+    python label_batch.py catalogue.csv --checkpoint run.ckpt --summary summary.json
+
+Этикетки каждой строки пишутся в свою папку <номер строки>_<care_type>
+внутри --output-dir: строки с одинаковым составом не перезаписывают
+файлы друг друга.
+
+Файл checkpoint дописывается после каждой строки: при повторном запуске
+с тем же файлом и теми же настройками (--imposed, --backend, --dpi,
+--color-mode, --pdf-writer) уже обработанные строки пропускаются.
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+from label_final import LabelGenerator, setup_logging
+
+
+def iter_rows(source, fmt=None):
+    """Лениво читает строки каталога: возвращает (номер строки, dict)"""
+    if fmt is None:
+        fmt = 'jsonl' if str(source).endswith(('.jsonl', '.ndjson')) else 'csv'
+
+    stream = sys.stdin if str(source) == '-' else open(source, encoding='utf-8-sig', newline='')
+    try:
+        if fmt == 'jsonl':
+            for line_no, line in enumerate(stream, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield line_no, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_no, {'_error': f"некорректный JSON: {e}"}
+        else:
+            reader = csv.DictReader(stream)
+            for row in reader:
+                # Номер строки файла (с учётом заголовка)
+                yield reader.line_num, row
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def _split_list(value):
+    """'36; 38,40' -> ['36', '38', '40'] (списки из JSONL возвращаются как есть)"""
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [v.strip() for v in re.split(r'[;,]', str(value)) if v.strip()]
+
+
+def _norm(value):
+    """Сравнение без учёта регистра и ё/е"""
+    return str(value).strip().lower().replace('ё', 'е')
+
+
+def normalize_row(generator, row):
+    """Проверяет строку каталога и приводит её к аргументам генератора
+
+    Возвращает (composition, care_type, sizes, colors, quantity) или бросает ValueError.
+    """
+    if '_error' in row:
+        raise ValueError(row['_error'])
+
+    composition = str(row.get('composition') or '').strip()
+    if not composition:
+        raise ValueError("пустой состав")
+
+    care_input = _norm(row.get('care_type') or '')
+    care_type = None
+    for key, care in generator.CARE_OPTIONS.items():
+        if care_input in (key, _norm(care['name'])):
+            care_type = key
+    if care_type is None:
+        raise ValueError(f"неизвестный вариант ухода: '{care_input}'")
+
+    sizes = _split_list(row.get('sizes'))
+    if not sizes or [s.lower() for s in sizes] == ['all']:
+        sizes = list(generator.SIZES)
+    unknown = [s for s in sizes if s not in generator.SIZES]
+    if unknown:
+        raise ValueError(f"неизвестные размеры: {', '.join(unknown)}")
+
+    colors = []
+    for color_input in _split_list(row.get('colors')):
+        color_input = _norm(color_input)
+        if color_input == 'all':
+            colors = list(generator.COLORS.keys())
+            break
+        for key, color in generator.COLORS.items():
+            if color_input in (key, _norm(color['name'])):
+                colors.append(key)
+                break
+        else:
+            raise ValueError(f"неизвестный цвет: '{color_input}'")
+    if not colors:
+        colors = list(generator.COLORS.keys())
+
+    quantity = row.get('quantity')
+    try:
+        quantity = int(quantity) if quantity not in (None, '') else 1
+    except (TypeError, ValueError):
+        raise ValueError(f"некорректное количество: '{quantity}'")
+    if quantity < 1:
+        raise ValueError(f"некорректное количество: {quantity}")
+
+    return composition, care_type, sizes, colors, quantity
+
+
+def row_key(line_no, row, options=None):
+    """Ключ строки для checkpoint: номер + хэш содержимого и настроек запуска"""
+    payload = json.dumps([row, options or {}], ensure_ascii=False, sort_keys=True, default=str)
+    return f"{line_no}:{hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]}"
+
+
+def load_checkpoint(path):
+    """Читает результаты уже обработанных строк {ключ: результат}"""
+    done = {}
+    if path is None or not Path(path).exists():
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Недописанная строка после аварийной остановки
+                continue
+            done[record['key']] = record
+    return done
+
+
+class BatchRunner:
+    """Обработка каталога строка за строкой с checkpoint и отчётом"""
+
+    def __init__(self, generator, checkpoint=None, imposed=False, workers=None,
+                 retry_failed=False, progress_every=10):
+        self.logger = logging.getLogger(__name__)
+        self.generator = generator
+        self.checkpoint = checkpoint
+        self.imposed = imposed
+        self.workers = workers
+        self.retry_failed = retry_failed
+        self.progress_every = progress_every
+        # С другими настройками результат другой - строка обрабатывается заново
+        self.options = {
+            'imposed': imposed,
+            'backend': generator.BACKEND,
+            'pdf_writer': generator.PDF_WRITER,
+            'color_mode': generator.COLOR_MODE,
+            'render_dpi': generator.RENDER_DPI,
+        }
+
+    def row_output_dir(self, line_no, care_type):
+        """Своя папка строки: одинаковые составы в разных строках не перезаписываются"""
+        return Path(self.generator.output_dir) / f"{line_no:05d}_{care_type}"
+
+    def process_row(self, line_no, row):
+        """Генерирует этикетки одной строки, возвращает запись для отчёта"""
+        record = {'key': row_key(line_no, row, self.options), 'row': line_no}
+        try:
+            composition, care_type, sizes, colors, quantity = normalize_row(self.generator, row)
+        except ValueError as e:
+            record.update(status='error', error=str(e), generated=0, failed=0)
+            return record
+
+        record['composition'] = composition
+        expected = len(sizes) * len(colors)
+        output_dir = self.row_output_dir(line_no, care_type)
+        record['output_dir'] = str(output_dir)
+        try:
+            if self.imposed:
+                skipped = []
+                sheet_folder = output_dir / composition
+                sheet_folder.mkdir(parents=True, exist_ok=True)
+                placed = self.generator.generate_imposed_pdf(
+                    composition, care_type,
+                    quantities={size: quantity for size in sizes},
+                    colors=colors,
+                    pdf_output_path=sheet_folder / f"{composition}_печать.pdf",
+                    failures=skipped
+                )
+                # Лист собирается и без пропущенных этикеток - их считаем отдельно
+                generated = expected - len(skipped) if placed else 0
+                record['placed'] = placed
+                if skipped:
+                    record['skipped'] = skipped
+            else:
+                generated = self.generator.generate_all_labels(
+                    composition, care_type, sizes, colors, workers=self.workers,
+                    output_dir=output_dir
+                )
+        except Exception as e:
+            self.logger.error(f"❌ Строка {line_no}: {e}", exc_info=True)
+            record.update(status='error', error=str(e), generated=0, failed=expected)
+            return record
+
+        failed = expected - generated
+        record.update(
+            status='ok' if failed == 0 else 'error',
+            generated=generated,
+            failed=failed,
+        )
+        if failed:
+            record['error'] = f"не создано этикеток: {failed}"
+        return record
+
+    def run(self, rows):
+        """Обрабатывает поток строк, возвращает список записей (включая прошлые запуски)"""
+        done = load_checkpoint(self.checkpoint)
+        if done:
+            self.logger.info(f"♻️ Checkpoint: уже обработано строк: {len(done)}")
+
+        results = dict(done)
+        started = time.monotonic()
+        processed = skipped = labels = 0
+
+        checkpoint_file = open(self.checkpoint, 'a', encoding='utf-8') if self.checkpoint else None
+        try:
+            for line_no, row in rows:
+                key = row_key(line_no, row, self.options)
+                previous = done.get(key)
+                if previous and (previous['status'] == 'ok' or not self.retry_failed):
+                    skipped += 1
+                    continue
+
+                record = self.process_row(line_no, row)
+                results[key] = record
+                processed += 1
+                labels += record['generated']
+
+                if checkpoint_file:
+                    checkpoint_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    checkpoint_file.flush()
+                    os.fsync(checkpoint_file.fileno())
+
+                if record['status'] != 'ok':
+                    self.logger.warning(f"⚠️ Строка {line_no}: {record.get('error')}")
+
+                if processed % self.progress_every == 0:
+                    elapsed = time.monotonic() - started
+                    self.logger.info(
+                        f"⏳ Обработано строк: {processed} (пропущено {skipped}), "
+                        f"этикеток: {labels}, {labels / elapsed:.1f} эт./с"
+                    )
+        finally:
+            if checkpoint_file:
+                checkpoint_file.close()
+
+        elapsed = time.monotonic() - started
+        self.logger.info(f"Пакет завершён: строк {processed}, пропущено {skipped}, "
+                         f"этикеток {labels} за {elapsed:.1f} с")
+        return sorted(results.values(), key=lambda r: r['row'])
+
+
+def build_summary(records):
+    """Сводка для машинной обработки"""
+    return {
+        'rows_total': len(records),
+        'rows_ok': sum(1 for r in records if r['status'] == 'ok'),
+        'rows_failed': sum(1 for r in records if r['status'] != 'ok'),
+        'labels_generated': sum(r['generated'] for r in records),
+        'labels_failed': sum(r['failed'] for r in records),
+        'rows': records,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетная генерация этикеток из CSV/JSONL")
+    parser.add_argument('source', help="файл каталога (.csv / .jsonl) или '-' для stdin")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="формат (по умолчанию - по расширению)")
+    parser.add_argument('--output-dir', help="папка для этикеток")
+    parser.add_argument('--checkpoint', help="файл checkpoint для продолжения прерванного запуска")
+    parser.add_argument('--summary', default='batch_summary.json', help="куда записать итоговый JSON")
+    parser.add_argument('--imposed', action='store_true', help="один PDF-лист на строку с учётом quantity")
+    parser.add_argument('--workers', type=int, help="число процессов (0 - все ядра)")
+    parser.add_argument('--backend', choices=['raster', 'vector'], help="способ вывода текста в PDF")
+    parser.add_argument('--pdf-writer', choices=['lean', 'reportlab'], help="запись растровых PDF")
+    parser.add_argument('--color-mode', choices=['auto', 'rgb', 'gray', '1bit'], help="глубина цвета этикеток")
+    parser.add_argument('--dpi', type=int, help="разрешение растра этикетки (203 / 300 / 600)")
+    parser.add_argument('--cache-dir', help="папка постоянного кэша готовых PDF")
+    parser.add_argument('--cache-max-mb', type=int, default=512, help="лимит кэша, МБ")
+    parser.add_argument('--template-pack', help="пакет шаблонов (python label_pack.py build ...)")
+    parser.add_argument('--retry-failed', action='store_true', help="повторить строки с ошибками из checkpoint")
+    parser.add_argument('--progress-every', type=int, default=10, help="как часто писать прогресс (строк)")
+    parser.add_argument('--log-mode', choices=['detailed', 'summary'],
+                        help="summary - одна строка лога на этикетку")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    generator = LabelGenerator()
+    if args.output_dir:
+        generator.output_dir = Path(args.output_dir)
+        generator.output_dir.mkdir(parents=True, exist_ok=True)
+    if args.backend:
+        generator.BACKEND = args.backend
+    if args.pdf_writer:
+        generator.PDF_WRITER = args.pdf_writer
+    if args.color_mode:
+        generator.COLOR_MODE = args.color_mode
+    if args.dpi:
+        generator.RENDER_DPI = args.dpi
+    if args.log_mode:
+        generator.LOG_MODE = args.log_mode
+    if args.template_pack:
+        generator.use_template_pack(args.template_pack)
+    if args.cache_dir:
+        generator.enable_output_cache(args.cache_dir, max_bytes=args.cache_max_mb * 1024 * 1024)
+
+    runner = BatchRunner(
+        generator,
+        checkpoint=args.checkpoint,
+        imposed=args.imposed,
+        workers=args.workers,
+        retry_failed=args.retry_failed,
+        progress_every=max(1, args.progress_every),
+    )
+    records = runner.run(iter_rows(args.source, args.format))
+    summary = build_summary(records)
+
+    if generator.output_cache is not None:
+        summary['cache'] = generator.output_cache.stats()
+    Path(args.summary).write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding='utf-8')
+
+    return 0 if summary['rows_failed'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,393 @@
+"""
+Бенчмарк конвейера этикеток herself19
+
+Замеряет отдельные этапы (parse_composition, load_font, create_label_image,
+image_to_png, png_to_pdf, image_to_pdf_bytes, generate_all_labels) и матрицу
+полных прогонов: варианты ухода × цвета × размеры, короткий и длинный
+(5 материалов) состав, последовательный и параллельный режим.
+
+Для каждого случая: этикеток в секунду, p50/p95 задержки, пиковый RSS
+и байт PDF на этикетку. Работает офлайн на шаблонах и шрифте из репозитория.
+
+Каждый случай выполняется в отдельном процессе (--case): ru_maxrss - пик за
+всю жизнь процесса, в общем процессе RSS случаев только бы рос.
+Параллельные случаи, где заданий меньше PARALLEL_MIN_JOBS (пул всё равно
+не запускается), в матрицу не входят.
+
+Примеры:
+    python label_bench.py --save-baseline bench_baseline.json
+    python label_bench.py --compare bench_baseline.json --threshold 0.2
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import PIL
+
+try:
+    import resource
+except ImportError:  # Windows - пиковый RSS не замеряется
+    resource = None
+
+from label_final import LAYER_CACHE, PARALLEL_MIN_JOBS, TEMPLATE_CACHE, LabelGenerator, load_reportlab
+
+COMPOSITIONS = {
+    'short': "95% Хлопок, 5% Эластан",
+    'long': "40% Шерсть, 30% Вискоза, 20% Полиэстер, 5% Кашемир, 5% Эластан",
+}
+
+
+def percentile(values, q):
+    """Перцентиль q (0..100) с линейной интерполяцией"""
+    values = sorted(values)
+    if not values:
+        return 0.0
+    pos = (len(values) - 1) * q / 100
+    low = int(pos)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (pos - low)
+
+
+def peak_rss_mb():
+    """Пиковый RSS процесса и его дочерних процессов за всё время их жизни, МБ
+
+    None - замер недоступен (нет модуля resource).
+    """
+    if resource is None:
+        return None
+    # ru_maxrss: Linux - КБ, macOS - байты
+    unit = 1 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit
+    return round(max(own, children) / (1024 * 1024), 1)
+
+
+def summarize(name, durations, labels=None, output_bytes=None):
+    """Метрики случая по списку длительностей (секунды на операцию)"""
+    total = sum(durations)
+    count = labels if labels is not None else len(durations)
+    result = {
+        'name': name,
+        'count': count,
+        'seconds': round(total, 4),
+        'per_s': round(count / total, 2) if total else None,
+        'p50_ms': round(percentile(durations, 50) * 1000, 3),
+        'p95_ms': round(percentile(durations, 95) * 1000, 3),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    if output_bytes is not None:
+        result['bytes_per_label'] = round(output_bytes / max(count, 1))
+    return result
+
+
+def timed(fn, repeats):
+    """Вызывает fn() repeats раз, возвращает длительности"""
+    durations = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def clear_caches():
+    """Холодный старт для случая: кэши шаблонов и слоёв пустые"""
+    TEMPLATE_CACHE.clear()
+    LAYER_CACHE.clear()
+
+
+def stage_cases(generator, workdir, repeats):
+    """Отдельные этапы конвейера: (имя, функция случая -> метрики)"""
+    template = generator.CARE_OPTIONS['washable']['templates']['white']
+
+    for key, composition in COMPOSITIONS.items():
+        yield f"parse_composition/{key}", lambda composition=composition, key=key: summarize(
+            f"parse_composition/{key}",
+            timed(lambda: generator.parse_composition(composition), repeats * 100),
+        )
+
+    yield "load_font", lambda: summarize(
+        "load_font",
+        timed(lambda: generator.load_font(generator.FONT_SIZES['size_large']), repeats * 100),
+    )
+
+    def create_label_image(key, composition):
+        clear_caches()
+        sizes = iter(generator.SIZES * repeats)
+        return summarize(
+            f"create_label_image/{key}",
+            timed(lambda: generator.create_label_image(template, next(sizes), composition, 'white'),
+                  repeats * len(generator.SIZES)),
+        )
+
+    for key, composition in COMPOSITIONS.items():
+        yield f"create_label_image/{key}", lambda key=key, composition=composition: create_label_image(
+            key, composition)
+
+    png_path = workdir / 'bench.png'
+    pdf_path = workdir / 'bench.pdf'
+
+    def label():
+        return generator.create_label_image(template, '42', COMPOSITIONS['long'], 'white')
+
+    def image_to_png():
+        image = label()
+        durations = timed(lambda: generator.image_to_png(image, png_path), repeats)
+        return summarize("image_to_png", durations, output_bytes=png_path.stat().st_size * repeats)
+
+    def png_to_pdf():
+        generator.image_to_png(label(), png_path)
+        durations = timed(lambda: generator.png_to_pdf(png_path, pdf_path), repeats)
+        return summarize("png_to_pdf", durations, output_bytes=pdf_path.stat().st_size * repeats)
+
+    def image_to_pdf_bytes():
+        image = label()
+        pdf_bytes = generator.image_to_pdf_bytes(image)
+        durations = timed(lambda: generator.image_to_pdf_bytes(image), repeats)
+        return summarize("image_to_pdf_bytes", durations, output_bytes=len(pdf_bytes) * repeats)
+
+    def generate_all_labels():
+        generator.output_dir = workdir / 'output'
+        generator.output_dir.mkdir(exist_ok=True)
+        return summarize(
+            "generate_all_labels",
+            timed(lambda: generator.generate_all_labels(COMPOSITIONS['short'], 'washable', workers=1), repeats),
+            labels=len(generator.SIZES) * len(generator.COLORS) * repeats,
+        )
+
+    yield "image_to_png", image_to_png
+    yield "png_to_pdf", png_to_pdf
+    yield "image_to_pdf_bytes", image_to_pdf_bytes
+    yield "generate_all_labels", generate_all_labels
+
+
+def matrix_cases(generator, parallel_workers):
+    """Матрица полных прогонов
+
+    Параллельный вариант - только если за один вызов iter_labels заданий
+    не меньше PARALLEL_MIN_JOBS: иначе он выполнился бы последовательно.
+    """
+    care_types = list(generator.CARE_OPTIONS)
+    colors = list(generator.COLORS)
+    for care_count in (1, len(care_types)):
+        for color_count in (1, len(colors)):
+            for size_count in (1, len(generator.SIZES)):
+                jobs = color_count * size_count
+                for comp_key in COMPOSITIONS:
+                    for workers in sorted({1, parallel_workers}):
+                        if workers > 1 and jobs < PARALLEL_MIN_JOBS:
+                            continue
+                        name = (f"matrix/care{care_count}-colors{color_count}-sizes{size_count}"
+                                f"-{comp_key}-w{workers}")
+                        yield name, {
+                            'care_types': care_types[:care_count],
+                            'colors': colors[:color_count],
+                            'sizes': generator.SIZES[:size_count],
+                            'composition': COMPOSITIONS[comp_key],
+                            'workers': workers,
+                        }
+
+
+def bench_matrix_case(generator, name, case, repeats):
+    """Полный прогон: задержка - интервал между готовыми этикетками iter_labels"""
+    durations = []
+    output_bytes = 0
+    for _ in range(repeats):
+        clear_caches()
+        for care_type in case['care_types']:
+            started = time.perf_counter()
+            for _, pdf_bytes in generator.iter_labels(
+                case['composition'], care_type, case['sizes'], case['colors'],
+                workers=case['workers']
+            ):
+                now = time.perf_counter()
+                durations.append(now - started)
+                started = now
+                output_bytes += len(pdf_bytes)
+    return summarize(name, durations, output_bytes=output_bytes)
+
+
+def all_cases(generator, workdir, args, parallel_workers):
+    """Все случаи прогона: (имя, функция случая -> метрики)"""
+    yield from stage_cases(generator, workdir, args.repeats)
+    if args.skip_matrix:
+        return
+    for name, case in matrix_cases(generator, parallel_workers):
+        yield name, lambda name=name, case=case: bench_matrix_case(generator, name, case, args.matrix_repeats)
+
+
+# Метрики для сравнения: (ключ, True - чем больше, тем лучше)
+COMPARED_METRICS = [
+    ('per_s', True),
+    ('p95_ms', False),
+    ('bytes_per_label', False),
+    ('peak_rss_mb', False),
+]
+
+
+def compare(current, baseline, thresholds):
+    """Список регрессий относительно базового JSON"""
+    baseline_cases = {case['name']: case for case in baseline['results']}
+    regressions = []
+    for case in current['results']:
+        base = baseline_cases.get(case['name'])
+        if base is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS:
+            new, old = case.get(metric), base.get(metric)
+            if not new or not old:
+                continue
+            limit = thresholds[metric]
+            change = (new - old) / old
+            if (higher_is_better and change < -limit) or (not higher_is_better and change > limit):
+                regressions.append({
+                    'name': case['name'],
+                    'metric': metric,
+                    'baseline': old,
+                    'current': new,
+                    'change': round(change, 3),
+                })
+    return regressions
+
+
+def make_generator(args):
+    generator = LabelGenerator()
+    if args.backend:
+        generator.BACKEND = args.backend
+    if args.pdf_writer:
+        generator.PDF_WRITER = args.pdf_writer
+    if args.dpi:
+        generator.RENDER_DPI = args.dpi
+    return generator
+
+
+def run_case(args):
+    """Один случай в этом процессе (вызывается родителем через --case)"""
+    generator = make_generator(args)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cases = dict(all_cases(generator, Path(temp_dir), args, args.workers))
+        if args.case not in cases:
+            raise ValueError(f"неизвестный случай: {args.case}")
+        return cases[args.case]()
+
+
+def case_argv(args, parallel_workers):
+    """Аргументы командной строки для процесса одного случая"""
+    argv = [sys.executable, str(Path(__file__).resolve()),
+            '--repeats', str(args.repeats), '--matrix-repeats', str(args.matrix_repeats),
+            '--workers', str(parallel_workers)]
+    for option in ('backend', 'pdf_writer', 'dpi'):
+        value = getattr(args, option)
+        if value:
+            argv += [f"--{option.replace('_', '-')}", str(value)]
+    return argv
+
+
+def run(args):
+    generator = make_generator(args)
+    parallel_workers = args.workers or os.cpu_count() or 1
+    logger = logging.getLogger(__name__)
+
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        names = [name for name, _ in all_cases(generator, Path(temp_dir), args, parallel_workers)]
+    for name in names:
+        # Свой процесс на случай: пиковый RSS и кэши не переходят из случая в случай
+        completed = subprocess.run(case_argv(args, parallel_workers) + ['--case', name],
+                                   capture_output=True, text=True, encoding='utf-8')
+        if completed.returncode != 0:
+            raise RuntimeError(f"случай {name} завершился с ошибкой:\n{completed.stderr}")
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+        logger.info(f"{name}: {results[-1]['per_s']} эт./с, p95 {results[-1]['p95_ms']} мс")
+
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'pillow': PIL.__version__,
+            'reportlab': load_reportlab().version,
+            'backend': generator.BACKEND,
+            'pdf_writer': generator.PDF_WRITER,
+            'render_size': generator.render_size(),
+        },
+        'results': results,
+    }
+
+
+def print_table(report):
+    print(f"{'случай':<58} {'в сек':>9} {'p50 мс':>9} {'p95 мс':>9} {'RSS МБ':>8} {'байт/эт':>9}")
+    for case in report['results']:
+        print(f"{case['name']:<58} {case['per_s'] or 0:>9} {case['p50_ms']:>9} {case['p95_ms']:>9} "
+              f"{case['peak_rss_mb'] or '-':>8} {case.get('bytes_per_label', ''):>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк генератора этикеток")
+    parser.add_argument('--repeats', type=int, default=5, help="повторов для отдельных этапов")
+    parser.add_argument('--matrix-repeats', type=int, default=1, help="повторов для матрицы")
+    parser.add_argument('--skip-matrix', action='store_true', help="только отдельные этапы")
+    parser.add_argument('--workers', type=int, help="процессов для параллельных случаев (по умолчанию - все ядра)")
+    parser.add_argument('--backend', choices=['raster', 'vector'])
+    parser.add_argument('--pdf-writer', choices=['lean', 'reportlab'])
+    parser.add_argument('--dpi', type=int)
+    parser.add_argument('--output', help="записать результаты в JSON")
+    parser.add_argument('--save-baseline', help="сохранить результаты как базовые")
+    parser.add_argument('--compare', help="сравнить с базовым JSON")
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="допустимое ухудшение скорости и задержки (доля)")
+    parser.add_argument('--bytes-threshold', type=float, default=0.05,
+                        help="допустимый рост размера PDF (доля)")
+    parser.add_argument('--rss-threshold', type=float, default=0.25,
+                        help="допустимый рост пикового RSS (доля)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(message)s')
+    # Пути пользователя - относительно его текущей папки, до смены каталога
+    for option in ('output', 'save_baseline', 'compare'):
+        if getattr(args, option):
+            setattr(args, option, os.path.abspath(getattr(args, option)))
+    # Шаблоны и шрифт лежат рядом со скриптом
+    os.chdir(Path(__file__).resolve().parent)
+
+    if args.case:
+        # Процесс одного случая: метрики - последней строкой stdout
+        print(json.dumps(run_case(args), ensure_ascii=False))
+        return 0
+
+    report = run(args)
+    print_table(report)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            Path(path).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding='utf-8'))
+        thresholds = {
+            'per_s': args.threshold,
+            'p95_ms': args.threshold,
+            'bytes_per_label': args.bytes_threshold,
+            'peak_rss_mb': args.rss_threshold,
+        }
+        regressions = compare(report, baseline, thresholds)
+        for item in regressions:
+            print(f"❌ РЕГРЕССИЯ {item['name']} {item['metric']}: "
+                  f"{item['baseline']} -> {item['current']} ({item['change']:+.0%})")
+        if regressions:
+            return 1
+        print("✅ Регрессий нет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+Постоянный кэш готовых этикеток на диске (content-addressed)
+
+Ключ - хэш всех входных данных рендера (см. LabelGenerator.output_cache_key),
+значение - готовый PDF. Объём ограничен, при переполнении удаляются
+давно не использованные файлы (LRU по времени доступа).
+
+Кэш можно использовать из нескольких процессов одновременно:
+- запись идёт во временный файл и атомарно переименовывается;
+- очистка выполняется под файловой блокировкой;
+- файл, удалённый другим процессом во время чтения, считается промахом.
+"""
+
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows - без межпроцессной блокировки очистки
+    fcntl = None
+
+
+class OutputCache:
+    """Кэш готовых PDF с ограничением по объёму и LRU-вытеснением"""
+
+    # Сколько записей делать между полными пересчётами объёма кэша
+    RESCAN_EVERY = 100
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, suffix='.pdf'):
+        self.logger = logging.getLogger(__name__)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self._approx_bytes = None
+        self._puts_since_scan = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['logger'], state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return self.directory / key[:2] / f"{key}{self.suffix}"
+
+    def get(self, key):
+        """Возвращает сохранённые байты или None"""
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            # Отмечаем использование для LRU
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """Сохраняет байты под ключом (атомарно) и при необходимости чистит кэш"""
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        with self._lock:
+            if self._approx_bytes is not None:
+                self._approx_bytes += len(data)
+            self._puts_since_scan += 1
+            need_check = (
+                self._approx_bytes is None
+                or self._approx_bytes > self.max_bytes
+                or self._puts_since_scan >= self.RESCAN_EVERY
+            )
+        if need_check:
+            self.evict()
+
+    def _entries(self):
+        """Все файлы кэша: (время доступа, размер, путь)"""
+        entries = []
+        for path in self.directory.glob(f"*/*{self.suffix}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    @contextmanager
+    def _process_lock(self):
+        """Файловая блокировка на время очистки (между процессами)"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.directory / '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def evict(self):
+        """Удаляет самые старые записи, пока объём не станет меньше 90% лимита"""
+        with self._process_lock():
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            if total > self.max_bytes:
+                target = int(self.max_bytes * 0.9)
+                for _, size, path in sorted(entries):
+                    if total <= target:
+                        break
+                    try:
+                        path.unlink()
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                    removed += 1
+                self.logger.debug(f"Кэш этикеток: удалено {removed} записей")
+
+        with self._lock:
+            self._approx_bytes = total
+            self._puts_since_scan = 0
+            self.evictions += removed
+
+    def clear(self):
+        """Удаляет все записи и сбрасывает счётчики"""
+        with self._process_lock():
+            for _, _, path in self._entries():
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+        with self._lock:
+            self._approx_bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Счётчики попаданий/промахов и текущий объём"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'bytes': self._approx_bytes,
+                'max_bytes': self.max_bytes,
+            }
@@ -8,40 +8,595 @@
 - Полная поддержка кириллицы
 - Высокое качество 1064px @ 300DPI
 - УВЕЛИЧЕННЫЙ БОС ТЕКСТА СОСТАВА
-- ✅ ВСЕ ВАРИАНТЫ -> PNG -> PDF (текст конвертируется в вектор)
+- ✅ ВСЕ ВАРИАНТЫ -> Image -> PDF в памяти (PNG на диск - только для отладки)
+- ✅ RENDER_DPI - растр сразу в разрешении принтера (раскладка в мм, layout_mm)
+- ✅ BACKEND='vector' - текст контурами глифов поверх шаблона (label_vector.py)
+- ✅ PDF_WRITER='lean' - растр в PDF одним Flate-сжатием, без reportlab (label_pdf.py)
+- ✅ Логи через очередь (отдельный поток), LOG_MODE='summary' и тайминги этапов (RenderStats)
+- ✅ reportlab загружается при первом PDF, start_warmup() - прогрев кэшей в фоне
 
-Требования: Python 3.8+, Pillow, reportlab
+Требования: Python 3.8+, Pillow, reportlab (fonttools - для векторного режима)
 
 """
 
+import atexit
+import hashlib
+import io
+import json
+import multiprocessing
 import os
+import queue
 import sys
-from PIL import Image, ImageDraw, ImageFont
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+import PIL
+from PIL import Image, ImageChops, ImageDraw, ImageFont
 from pathlib import Path
 from datetime import datetime
+from types import SimpleNamespace
 import logging
+import logging.handlers
 
-try:
-    from reportlab.pdfgen import canvas as rl_canvas
-    from reportlab.lib.units import inch, mm
-except ImportError:
-    print("Ошибка: reportlab не установлен")
-    print("Установите: pip install reportlab pillow")
-    sys.exit(1)
+from label_cache import OutputCache
+from label_pdf import PDF_WRITER_VERSION, image_pdf
+
+# Миллиметр в пунктах PDF (как reportlab.lib.units.mm)
+mm = 72.0 / 2.54 * 0.1
+
+# reportlab импортируется при первом создании PDF (см. load_reportlab):
+# запуск приложения и превью не ждут импорта, а без пакета падает только PDF
+_REPORTLAB = None
+_REPORTLAB_LOCK = threading.Lock()
+
+def load_reportlab():
+    """Модули reportlab: canvas, ImageReader, version (импорт один раз на процесс)"""
+    global _REPORTLAB
+    with _REPORTLAB_LOCK:
+        if _REPORTLAB is None:
+            try:
+                from reportlab.pdfgen import canvas
+                from reportlab.lib.utils import ImageReader
+                from reportlab import Version, rl_config
+            except ImportError as e:
+                raise ImportError("Для создания PDF установите: pip install reportlab") from e
+            # PDF и так бинарный: ASCII85 только раздувает потоки изображений на 25%
+            rl_config.useA85 = 0
+            _REPORTLAB = SimpleNamespace(canvas=canvas, ImageReader=ImageReader, version=Version)
+        return _REPORTLAB
+
+# Поток записи логов (см. setup_logging)
+_LOG_LISTENER = None
 
 # Настройка логирования
-def setup_logging(log_file='label_generator.log'):
-    """Настраивает логирование"""
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_file, encoding='utf-8'),
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
+def setup_logging(log_file='label_generator.log', queued=True, level=logging.INFO, console=None):
+    """Настраивает логирование
+
+    queued=True - вызовы логгера только кладут запись в очередь, файл и консоль
+    пишет отдельный поток (QueueListener), генерация не ждёт ввода-вывода.
+    console - поток для вывода в консоль (по умолчанию stdout; sys.stderr -
+    если stdout занят результатом, например заданием ZPL).
+    """
+    global _LOG_LISTENER
+    log_format = '%(asctime)s - %(levelname)s - %(message)s'
+    handlers = [
+        logging.FileHandler(log_file, encoding='utf-8'),
+        logging.StreamHandler(console or sys.stdout)
+    ]
+    
+    if not queued:
+        logging.basicConfig(level=level, format=log_format, handlers=handlers)
+        return logging.getLogger(__name__)
+    
+    if _LOG_LISTENER is None:
+        formatter = logging.Formatter(log_format)
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        log_queue = queue.SimpleQueue()
+        _LOG_LISTENER = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _LOG_LISTENER.start()
+        # Дописываем очередь при выходе
+        atexit.register(_LOG_LISTENER.stop)
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        # Сообщение подставляется в очередь как есть, оформление - у обработчиков потока
+        queue_handler.setFormatter(logging.Formatter('%(message)s'))
+        logging.basicConfig(level=level, handlers=[queue_handler])
+    else:
+        for handler in handlers:
+            handler.close()
     return logging.getLogger(__name__)
 
+
+class RenderStats:
+    """Таймеры этапов и счётчики генерации
+
+    Этапы: template (загрузка шаблона), composition (панель состава),
+    rotate (поворот панели), draw (размер), png (отладочный PNG),
+    pdf_encode (сборка PDF в памяти), pdf_write (запись на диск).
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self._started = time.perf_counter()
+
+    def add_timings(self, timings):
+        """Добавляет длительности этапов одной этикетки {этап: секунды}"""
+        for stage, seconds in timings.items():
+            total, count = self.stages.get(stage, (0.0, 0))
+            self.stages[stage] = (total + seconds, count + 1)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def as_dict(self):
+        """Сводка: секунды и число вызовов по этапам, счётчики, общее время"""
+        return {
+            'stages': {
+                stage: {'seconds': round(total, 6), 'calls': count}
+                for stage, (total, count) in self.stages.items()
+            },
+            'counters': dict(self.counters),
+            'elapsed': round(time.perf_counter() - self._started, 6),
+        }
+
+
+class Warmup:
+    """Состояние фонового прогрева (см. LabelGenerator.start_warmup)"""
+
+    def __init__(self):
+        self.ready = threading.Event()
+        self.timings = {}
+        self.seconds = None
+        self.error = None
+
+    def wait(self, timeout=None):
+        """Ждёт окончания прогрева, True - если завершён"""
+        return self.ready.wait(timeout)
+
+    def as_dict(self):
+        return {
+            'ready': self.ready.is_set(),
+            'seconds': round(self.seconds, 4) if self.seconds is not None else None,
+            'stages': {stage: round(seconds, 4) for stage, seconds in self.timings.items()},
+            'error': self.error,
+        }
+
+
+@contextmanager
+def stage_timer(timings, stage):
+    """Замер этапа в словарь timings (None - без замера)"""
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started
+
+def decode_template(template_path, working_size):
+    """Декодирует шаблон в RGB и масштабирует до working_size x working_size"""
+    with Image.open(template_path) as template:
+        base = template.convert('RGB')
+    return base.resize((working_size, working_size), Image.Resampling.LANCZOS)
+
+
+class TemplateCache:
+    """Кэш готовых к отрисовке шаблонов (RGB, уже масштабированных)
+
+    Ключ: (вариант ухода, цвет, путь, mtime и размер файла, рабочий размер).
+    Наружу отдаются только копии, размер кэша ограничен (LRU).
+    С подключённым пакетом шаблонов (label_pack.py) промах берёт готовый
+    растр из mmap без декодирования JPEG.
+    """
+
+    def __init__(self, max_entries=16):
+        self.logger = logging.getLogger(__name__)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._grayscale = {}
+        self._lock = threading.Lock()
+        self.pack = None
+        self.hits = 0
+        self.misses = 0
+
+    def attach_pack(self, pack):
+        """Подключает пакет шаблонов (None - отключает), кэш очищается"""
+        with self._lock:
+            self.pack = pack
+            self._entries.clear()
+            self._grayscale.clear()
+
+    def _make_key(self, template_path, working_size, care_type, color):
+        stat = os.stat(template_path)
+        return (care_type, color, str(template_path), stat.st_mtime_ns, stat.st_size, working_size)
+
+    def get(self, template_path, working_size, care_type=None, color=None):
+        """Возвращает копию подготовленного шаблона, загружая его при промахе"""
+        key = self._make_key(template_path, working_size, care_type, color)
+        with self._lock:
+            base = self._entries.get(key)
+            if base is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._rgb_copy(base)
+
+        # Декодирование и ресемплинг - вне блокировки
+        base = self.pack.get(template_path, working_size) if self.pack is not None else None
+        if base is None:
+            base = decode_template(template_path, working_size)
+        self.logger.debug("Шаблон загружен в кэш: %s (%sx%s)", template_path, working_size, working_size)
+
+        with self._lock:
+            self.misses += 1
+            # Устаревшие версии того же файла (другие mtime/размер) больше не нужны;
+            # текущая версия в других разрешениях (предпросмотр, принтер) остаётся
+            for old_key in [k for k in self._entries if k[:3] == key[:3] and k[3:5] != key[3:5]]:
+                del self._entries[old_key]
+            self._entries[key] = base
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return self._rgb_copy(base)
+
+    @staticmethod
+    def _rgb_copy(base):
+        """Копия шаблона в RGB (растры пакета хранятся как RGBX поверх mmap)"""
+        return base.copy() if base.mode == 'RGB' else base.convert('RGB')
+
+    def is_grayscale(self, template_path, working_size, care_type=None, color=None, tolerance=32):
+        """Шаблон без цвета (R≈G≈B с учётом шума JPEG)? Результат запоминается"""
+        key = self._make_key(template_path, working_size, care_type, color) + (tolerance,)
+        with self._lock:
+            result = self._grayscale.get(key)
+        if result is not None:
+            return result
+
+        r, g, b = self.get(template_path, working_size, care_type=care_type, color=color).split()
+        spread = max(
+            ImageChops.difference(r, g).getextrema()[1],
+            ImageChops.difference(g, b).getextrema()[1],
+            ImageChops.difference(r, b).getextrema()[1],
+        )
+        result = spread <= tolerance
+        with self._lock:
+            self._grayscale[key] = result
+        return result
+
+    def invalidate(self, care_type=None, color=None, template_path=None):
+        """Удаляет записи по фильтру (без аргументов - очищает весь кэш)"""
+        with self._lock:
+            for key in list(self._entries):
+                if care_type is not None and key[0] != care_type:
+                    continue
+                if color is not None and key[1] != color:
+                    continue
+                if template_path is not None and key[2] != str(template_path):
+                    continue
+                del self._entries[key]
+            for key in list(self._grayscale):
+                if key[:6] not in self._entries:
+                    del self._grayscale[key]
+
+    def clear(self):
+        """Полностью очищает кэш и счётчики"""
+        with self._lock:
+            self._entries.clear()
+            self._grayscale.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Общий кэш шаблонов процесса (один на все экземпляры LabelGenerator)
+TEMPLATE_CACHE = TemplateCache()
+
+
+class LayerCache:
+    """Кэш готовых слоёв: шаблон + панель состава для одного цвета (LRU)
+
+    Панель состава одинакова для всех размеров, поэтому на этикетку остаётся
+    только копия слоя и отрисовка размера.
+    """
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, factory):
+        """Возвращает копию слоя по ключу, создавая его через factory() при промахе"""
+        with self._lock:
+            layer = self._entries.get(key)
+            if layer is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return layer.copy()
+
+        layer = factory()
+
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = layer
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return layer.copy()
+
+    def clear(self):
+        """Полностью очищает кэш и счётчики"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Общий кэш слоёв процесса
+LAYER_CACHE = LayerCache()
+
+
+class GlyphAtlas:
+    """Готовые маски текста (сглаженные, как у FreeType) для повторяющихся строк
+
+    Размеры, "ONE"/"SIZE", "СОСТАВ:" и строки состава повторяются из этикетки
+    в этикетку. Маска строки растеризуется один раз на (шрифт, кегль, строка,
+    режим) и дальше только переносится на изображение с нужным цветом -
+    результат совпадает с ImageDraw.text пиксель в пиксель (кернинг и
+    дробные позиции букв уже учтены в маске). Цвет в ключ не входит:
+    маска - это покрытие, цвет задаётся при переносе.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, font, text, mode):
+        """(маска, смещение) строки text для шрифта font в режиме 'L' / '1'"""
+        key = (font.path, font.size, text, mode)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        entry = font.getmask2(text, mode)
+
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def draw_text(self, draw, xy, text, fill, font):
+        """Аналог draw.text(xy, text, fill=fill, font=font) для целых координат"""
+        if not isinstance(font, ImageFont.FreeTypeFont) or '\n' in text:
+            draw.text(xy, text, fill=fill, font=font)
+            return
+        mask, (dx, dy) = self.get(font, text, draw.fontmode)
+        ink, fill_ink = draw._getink(fill)
+        if ink is None:
+            ink = fill_ink
+        draw.draw.draw_bitmap((int(xy[0]) + dx, int(xy[1]) + dy), mask, ink)
+
+    def clear(self):
+        """Полностью очищает атлас и счётчики"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Общий атлас текста процесса (воркеры получают готовые маски при fork)
+GLYPH_ATLAS = GlyphAtlas()
+
+
+# Версия алгоритма рендера: увеличить при любом изменении, влияющем на результат
+RENDER_VERSION = 1
+
+_FILE_DIGESTS = {}
+
+def file_digest(path):
+    """SHA-256 содержимого файла (пересчитывается только при изменении файла)"""
+    stat = os.stat(path)
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    digest = _FILE_DIGESTS.get(key)
+    if digest is None:
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        _FILE_DIGESTS[key] = digest
+    return digest
+
+
+# Шрифты в порядке приоритета
+FONT_OPTIONS = [
+    "montserrat-bold.ttf",
+    "arial.ttf",
+    "/Library/Fonts/Helvetica.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "C:\\Windows\\Fonts\\arial.ttf",
+]
+
+class FontRegistry:
+    """Реестр шрифтов: путь выбирается один раз, объекты FreeTypeFont кэшируются (LRU)"""
+
+    def __init__(self, font_options=None, max_fonts=32):
+        self.logger = logging.getLogger(__name__)
+        self.font_options = list(font_options or FONT_OPTIONS)
+        self.max_fonts = max_fonts
+        self.path = None
+        self._resolved = False
+        self._fonts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def resolve(self):
+        """Находит первый доступный шрифт из списка (выполняется один раз)"""
+        with self._lock:
+            if self._resolved:
+                return self.path
+            for font_path in self.font_options:
+                try:
+                    font = ImageFont.truetype(font_path, 10)
+                except OSError:
+                    continue
+                # truetype() ищет и в системных папках - запоминаем реальный путь
+                self.path = getattr(font, 'path', font_path)
+                self.logger.info(f"✅ Использован шрифт: {self.path}")
+                break
+            else:
+                self.logger.warning(f"⚠️ Шрифт не найден, используется стандартный PIL")
+            self._resolved = True
+            return self.path
+
+    def get(self, size):
+        """Возвращает шрифт нужного размера (из кэша, если уже загружен)"""
+        path = self.resolve()
+        key = (path, size)
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is not None:
+                self._fonts.move_to_end(key)
+                return font
+
+        if path is None:
+            font = ImageFont.load_default()
+        else:
+            font = ImageFont.truetype(path, size)
+        self.logger.debug("Шрифт загружен: %s (%spt)", path, size)
+
+        with self._lock:
+            self._fonts[key] = font
+            while len(self._fonts) > self.max_fonts:
+                self._fonts.popitem(last=False)
+        return font
+
+    def reset(self):
+        """Сбрасывает выбранный путь и кэш шрифтов"""
+        with self._lock:
+            self.path = None
+            self._resolved = False
+            self._fonts.clear()
+
+
+# Общий реестр шрифтов процесса
+FONT_REGISTRY = FontRegistry()
+
+
+def _reset_locks_after_fork():
+    """После fork блокировки могли остаться захваченными другим потоком родителя"""
+    TEMPLATE_CACHE._lock = threading.Lock()
+    LAYER_CACHE._lock = threading.Lock()
+    GLYPH_ATLAS._lock = threading.Lock()
+    FONT_REGISTRY._lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_locks_after_fork)
+
+
+# ==================== ПАРАЛЛЕЛЬНЫЙ РЕЖИМ ====================
+# Меньше этого числа этикеток пул процессов не запускается:
+# старт процессов обойдётся дороже самой отрисовки
+PARALLEL_MIN_JOBS = 8
+
+# Генератор внутри процесса-воркера (задаётся инициализатором пула)
+_WORKER_GENERATOR = None
+
+def _init_worker(generator, log_queue=None, log_level=logging.INFO):
+    """Инициализатор воркера: получает копию настроек и прогревает кэши
+
+    Записи лога уходят в log_queue родителя: унаследованный при fork
+    QueueHandler писал бы в копию очереди, которую никто не читает.
+    """
+    global _WORKER_GENERATOR
+    if log_queue is not None:
+        root = logging.getLogger()
+        root.handlers = [logging.handlers.QueueHandler(log_queue)]
+        root.setLevel(log_level)
+    _WORKER_GENERATOR = generator
+    generator.warm_caches()
+
+class _ForwardToLogger(logging.Handler):
+    """Записи воркеров - в логгеры родителя (с их обработчиками)"""
+
+    def emit(self, record):
+        logging.getLogger(record.name).handle(record)
+
+def _run_worker_job(job):
+    return _WORKER_GENERATOR._render_job(job)
+
+
+class AdmissionQueue:
+    """Ограничение числа одновременных генераций с очередью по порядку прихода
+
+    Общий объект на процесс (например, для всех сессий Streamlit):
+    одновременно работают не больше slots генераций, остальные ждут
+    и через on_wait(позиция) узнают своё место в очереди (1 - следующий).
+    """
+
+    def __init__(self, slots):
+        self.slots = max(1, slots)
+        self._cond = threading.Condition()
+        self._waiting = deque()
+        self._active = 0
+
+    @contextmanager
+    def admit(self, on_wait=None, poll=0.5):
+        """Ждёт свободного места; on_wait вызывается при смене позиции"""
+        ticket = object()
+        reported = None
+        with self._cond:
+            self._waiting.append(ticket)
+        try:
+            while True:
+                with self._cond:
+                    position = self._waiting.index(ticket)
+                    if position == 0 and self._active < self.slots:
+                        self._waiting.popleft()
+                        self._active += 1
+                        break
+                # Колбэк - вне блокировки, он может обращаться к UI
+                if on_wait is not None and position + 1 != reported:
+                    reported = position + 1
+                    on_wait(reported)
+                with self._cond:
+                    self._cond.wait(poll)
+        except BaseException:
+            # Сессию прервали в очереди - освобождаем место
+            with self._cond:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                self._cond.notify_all()
+            raise
+        
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {'slots': self.slots, 'active': self._active, 'waiting': len(self._waiting)}
+
 class LabelGenerator:
     """Класс для генерации этикеток в высоком качестве"""
     
@@ -129,18 +684,245 @@ class LabelGenerator:
             'height': 240
         }
         
+        # 🖨️ РАСКЛАДКА НА ЛИСТ ДЛЯ ТИПОГРАФИИ (всё в мм)
+        self.IMPOSITION = {
+            'page': 'A4',           # 'A4' или 'roll'
+            'roll_width_mm': 110,   # ширина рулона для page='roll'
+            'columns': None,        # None - сколько поместится
+            'rows': None,           # None - сколько поместится (для рулона - 10)
+            'margin_mm': 10,
+            'gap_mm': 4,            # расстояние между этикетками
+            'bleed_mm': 1,          # вылет под обрез (заливка цветом фона)
+            'cut_marks': True,
+            'mark_length_mm': 3,
+        }
+        
         # Применяем смещения к базовым координатам
         self.COORDINATES = self._apply_offsets()
         
+        # Кэш подготовленных шаблонов и реестр шрифтов
+        self.template_cache = TEMPLATE_CACHE
+        self.layer_cache = LAYER_CACHE
+        self.glyph_atlas = GLYPH_ATLAS
+        self.font_registry = FONT_REGISTRY
+        self.font_registry.resolve()
+        
+        # ⚙️ Количество процессов для генерации (1 - последовательно)
+        self.WORKERS = 1
+        
+        # 💾 Постоянный кэш готовых PDF (None - выключен, см. enable_output_cache)
+        self.output_cache = None
+        
+        # 🖋️ Способ вывода текста в PDF:
+        # 'raster' - вся этикетка одним изображением
+        # 'vector' - шаблон-изображение + текст контурами глифов (нужен fontTools)
+        self.BACKEND = 'raster'
+        # Разрешение шаблона-изображения в векторном PDF (текст от него не зависит)
+        self.VECTOR_TEMPLATE_DPI = 300
+        
+        # 📄 Запись растровых PDF:
+        # 'lean' - label_pdf.py: одно Flate-сжатие пикселей, байты детерминированы
+        # 'reportlab' - прежний путь через reportlab (1-bit встраивается как 8-bit)
+        self.PDF_WRITER = 'lean'
+        
+        # 📝 Подробность логов по этикеткам:
+        # 'detailed' - несколько строк на этикетку, 'summary' - одна строка с таймингами
+        self.LOG_MODE = 'detailed'
+        
+        # 🔍 Разрешение растра этикетки (DPI принтера: 203 / 300 / 600).
+        # None - прежний рабочий размер WORKING_SIZE (~772 DPI на 35 мм)
+        self.RENDER_DPI = None
+        
+        # 👀 Разрешение предпросмотра (preview_png): 150 DPI -> ~207px на 35 мм
+        self.PREVIEW_DPI = 150
+        
+        # 🎨 Глубина цвета этикетки:
+        # 'auto' - шаблоны без цвета (чёрно-белые) в 8-bit grayscale, цветные - RGB
+        # 'rgb' / 'gray' / '1bit' - принудительно
+        self.COLOR_MODE = 'auto'
+        self.GRAYSCALE_TOLERANCE = 32  # допустимый разброс каналов (шум JPEG)
+        
         # 📁 ВЫХОДНАЯ ДИРЕКТОРИЯ
+        # (создаётся при первой записи)
         self.output_dir = Path('output_labels')
-        self.output_dir.mkdir(exist_ok=True)
+        
+        # Фоновый прогрев кэшей (start_warmup)
+        self.warmup = None
+        
+        # 📦 Пакет шаблонов (label_pack.py): готовые растры через mmap вместо JPEG
+        self.TEMPLATE_PACK = None
         
         self.logger.info(f"📐 Координаты размера: x={self.COORDINATES['size']['x']}, y={self.COORDINATES['size']['y']}")
         self.logger.info(f"📐 Координаты ONE SIZE: x={self.COORDINATES['size_one_size']['x']}, y={self.COORDINATES['size_one_size']['y']}")
         self.logger.info(f"📐 Координаты состава: x={self.COORDINATES['composition']['x']}, y={self.COORDINATES['composition']['y']}")
         self.logger.info(f"📦 Размер бокса состава: {self.COMPOSITION_BOX['width']}x{self.COMPOSITION_BOX['height']}px")
 
+    def __getstate__(self):
+        """Настройки для передачи в процессы-воркеры (без кэшей и логгера)"""
+        state = self.__dict__.copy()
+        for key in ('logger', 'template_cache', 'layer_cache', 'glyph_atlas', 'font_registry',
+                    'output_cache', 'warmup'):
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.logger = logging.getLogger(__name__)
+        self.template_cache = TEMPLATE_CACHE
+        self.layer_cache = LAYER_CACHE
+        self.glyph_atlas = GLYPH_ATLAS
+        self.font_registry = FONT_REGISTRY
+        self.output_cache = None
+        self.warmup = None
+
+    def with_options(self, **options):
+        """Копия генератора с другими настройками (BACKEND, COLOR_MODE, RENDER_DPI...)
+
+        Для одной сессии или вызова: исходный генератор не меняется, кэши
+        общие. Вложенные словари (COLORS, IMPOSITION) заменяйте целиком.
+        """
+        clone = object.__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        for name, value in options.items():
+            if not hasattr(self, name):
+                raise AttributeError(f"неизвестная настройка генератора: {name}")
+            setattr(clone, name, value)
+        return clone
+
+    def enable_output_cache(self, directory='.label_cache', max_bytes=512 * 1024 * 1024):
+        """Включает постоянный кэш готовых PDF на диске"""
+        self.output_cache = OutputCache(directory, max_bytes=max_bytes)
+        self.logger.info(f"💾 Кэш этикеток: {self.output_cache.directory} "
+                         f"(до {max_bytes // (1024 * 1024)} МБ)")
+        return self.output_cache
+
+    def output_cache_key(self, template_path, size, composition, color, care_type=None):
+        """Хэш всех входных данных этикетки: одинаковый ключ - одинаковый PDF
+
+        Состав берётся после parse_composition, поэтому различия в пробелах
+        и регистре не создают новых записей.
+        """
+        font_path = self.font_registry.path
+        payload = {
+            'version': RENDER_VERSION,
+            'composition': self.parse_composition(composition),
+            'care_type': care_type,
+            'size': size,
+            'color': color,
+            'text_color': self.COLORS[color]['text_color'],
+            'template': file_digest(template_path),
+            'font': file_digest(font_path) if font_path else None,
+            'working_size': self.WORKING_SIZE,
+            'render_size': self.render_size(),
+            'final_size_mm': self.FINAL_SIZE_MM,
+            'font_sizes': self.FONT_SIZES,
+            'coordinates': self.COORDINATES,
+            'composition_box': self.COMPOSITION_BOX,
+            'backend': self.BACKEND,
+            'vector_template_dpi': self.VECTOR_TEMPLATE_DPI,
+            'pdf_writer': self.PDF_WRITER,
+            'color_mode': self.COLOR_MODE,
+            'grayscale_tolerance': self.GRAYSCALE_TOLERANCE,
+            'libraries': [PIL.__version__, self._pdf_library_version()],
+        }
+        data = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def _pdf_library_version(self):
+        """Версия кода, который пишет PDF этикетки (для ключа кэша)"""
+        if self.BACKEND == 'raster' and self.PDF_WRITER == 'lean':
+            return f"label_pdf {PDF_WRITER_VERSION}"
+        return load_reportlab().version
+
+    def use_template_pack(self, path):
+        """Подключает пакет шаблонов к кэшу шаблонов процесса
+
+        Несовместимый пакет (другая версия рендера или Pillow) не подключается.
+        Возвращает TemplatePack или None.
+        """
+        from label_pack import TemplatePack
+        self.TEMPLATE_PACK = str(path)
+        pack = TemplatePack(path)
+        if not pack.compatible():
+            self.logger.warning(f"⚠️ Пакет шаблонов {path} собран другой версией, шаблоны декодируются")
+            pack.close()
+            return None
+        self.template_cache.attach_pack(pack)
+        self.logger.info(f"📦 Пакет шаблонов: {path} (хэш {pack.content_hash[:12]})")
+        return pack
+
+    def warm_caches(self, timings=None):
+        """Заранее загружает все шаблоны, шрифты и PDF-backend в кэши процесса
+
+        timings - словарь для длительностей: template:<уход>/<цвет>, fonts,
+        glyphs, pdf_backend (секунды).
+        """
+        # Воркеры, запущенные без fork, подключают пакет заново
+        pack = self.template_cache.pack
+        if self.TEMPLATE_PACK and (pack is None or str(pack.path) != self.TEMPLATE_PACK):
+            with stage_timer(timings, 'template_pack'):
+                self.use_template_pack(self.TEMPLATE_PACK)
+        
+        size_px = self.render_size()
+        for care_type, care in self.CARE_OPTIONS.items():
+            for color, template_path in care['templates'].items():
+                try:
+                    with stage_timer(timings, f"template:{care_type}/{color}"):
+                        self.template_cache.get(
+                            template_path, size_px, care_type=care_type, color=color
+                        )
+                        # Проверка на ч/б тоже кэшируется
+                        self.label_mode(template_path, color, care_type=care_type, size_px=size_px)
+                except OSError as e:
+                    self.logger.warning(f"⚠️ Шаблон не загружен: {template_path} ({e})")
+        layout = self.layout_px(size_px)
+        with stage_timer(timings, 'fonts'):
+            for key in ('font_size_large', 'font_size_small', 'font_composition'):
+                self.load_font(layout[key])
+        
+        # Маски постоянных строк: размеры, ONE SIZE, заголовок состава
+        texts = [(layout['font_size_large'], size) for size in self.SIZES if size != 'ONE SIZE']
+        texts += [(layout['font_size_small'], "ONE"), (layout['font_size_small'], "SIZE"),
+                  (layout['font_composition'], "СОСТАВ:")]
+        with stage_timer(timings, 'glyphs'):
+            for font_size, text in texts:
+                font = self.load_font(font_size)
+                if isinstance(font, ImageFont.FreeTypeFont):
+                    self.glyph_atlas.get(font, text, 'L')
+        
+        try:
+            with stage_timer(timings, 'pdf_backend'):
+                load_reportlab()
+                if self.BACKEND == 'vector':
+                    self._vector_renderer()
+        except ImportError as e:
+            self.logger.warning(f"⚠️ {e}")
+
+    def start_warmup(self):
+        """Прогревает кэши в фоновом потоке - старт приложения не ждёт
+
+        Возвращает Warmup: готовность (ready / wait) и длительности этапов.
+        Повторный вызов возвращает тот же объект.
+        """
+        if self.warmup is not None:
+            return self.warmup
+        warmup = self.warmup = Warmup()
+        
+        def run():
+            started = time.perf_counter()
+            try:
+                self.warm_caches(warmup.timings)
+            except Exception as e:
+                warmup.error = str(e)
+                self.logger.error(f"❌ Ошибка прогрева кэшей: {e}", exc_info=True)
+            finally:
+                warmup.seconds = time.perf_counter() - started
+                warmup.ready.set()
+                self.logger.info(f"🔥 Прогрев завершён за {warmup.seconds * 1000:.0f} мс")
+        
+        threading.Thread(target=run, name='label-warmup', daemon=True).start()
+        return warmup
+
     def _apply_offsets(self):
         """Применяет смещения к базовым координатам"""
         coords = {}
@@ -165,6 +947,55 @@ class LabelGenerator:
         
         return coords
 
+    def render_size(self, dpi=None):
+        """Сторона растра этикетки в пикселях для заданного DPI
+
+        Без DPI (и RENDER_DPI = None) - прежний рабочий размер WORKING_SIZE.
+        """
+        dpi = dpi or self.RENDER_DPI
+        if not dpi:
+            return self.WORKING_SIZE
+        return max(1, round(self.FINAL_SIZE_MM / 25.4 * dpi))
+
+    def layout_mm(self):
+        """Раскладка этикетки в миллиметрах
+
+        Настройки выше (координаты, смещения, шрифты, бокс состава) задаются
+        в единицах сетки WORKING_SIZE, покрывающей FINAL_SIZE_MM. Здесь они
+        переводятся в мм - дальше растр строится под любой DPI из этих значений.
+        """
+        unit = self.FINAL_SIZE_MM / self.WORKING_SIZE
+        
+        def point(coords):
+            return (coords['x'] * unit, coords['y'] * unit)
+        
+        return {
+            'size': point(self.COORDINATES['size']),
+            'size_one_size': point(self.COORDINATES['size_one_size']),
+            'composition': point(self.COORDINATES['composition']),
+            'composition_box': (self.COMPOSITION_BOX['width'] * unit, self.COMPOSITION_BOX['height'] * unit),
+            'composition_padding': 10 * unit,
+            'font_size_large': self.FONT_SIZES['size_large'] * unit,
+            'font_size_small': self.FONT_SIZES['size_small'] * unit,
+            'font_composition': self.FONT_SIZES['composition'] * unit,
+            'line_spacing_composition': int(self.FONT_SIZES['line_spacing_composition'] * 1.5) * unit,
+            'line_spacing_onesize': self.FONT_SIZES['line_spacing_onesize'] * unit,
+        }
+
+    def layout_px(self, size_px=None):
+        """Раскладка в целых пикселях для растра size_px x size_px"""
+        px_per_mm = (size_px or self.WORKING_SIZE) / self.FINAL_SIZE_MM
+        
+        def px(value):
+            if isinstance(value, tuple):
+                return tuple(round(v * px_per_mm) for v in value)
+            return round(value * px_per_mm)
+        
+        layout = {key: px(value) for key, value in self.layout_mm().items()}
+        for key in ('font_size_large', 'font_size_small', 'font_composition'):
+            layout[key] = max(1, layout[key])
+        return layout
+
     def parse_composition(self, composition_input):
         """Парсит строку состава в формат: "50% МАТЕРИАЛ1" """
         if not composition_input:
@@ -183,149 +1014,434 @@ class LabelGenerator:
             else:
                 formatted_materials.append(material.upper())
         
-        self.logger.debug(f"Распарсено материалов: {len(formatted_materials)}")
+        self.logger.debug("Распарсено материалов: %d", len(formatted_materials))
         return formatted_materials[:5]
 
     def load_font(self, size):
-        """Загружает шрифт с автоматическим fallback"""
-        font_options = [
-            "montserrat-bold.ttf",
-            "arial.ttf",
-            "/Library/Fonts/Helvetica.ttf",
-            "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
-            "C:\\Windows\\Fonts\\arial.ttf",
-        ]
-        
-        for font_path in font_options:
-            try:
-                font = ImageFont.truetype(font_path, size)
-                self.logger.debug(f"✅ Использован шрифт: {font_path} ({size}pt)")
-                return font
-            except:
-                continue
+        """Загружает шрифт с автоматическим fallback (через реестр шрифтов)"""
+        return self.font_registry.get(size)
+
+    def label_mode(self, template_path, color, care_type=None, size_px=None):
+        """Режим PIL для этикетки: 'RGB', 'L' (8-bit серый) или '1' (1-bit)"""
+        if self.COLOR_MODE == 'rgb':
+            return 'RGB'
+        if self.COLOR_MODE == 'gray':
+            return 'L'
+        if self.COLOR_MODE == '1bit':
+            return '1'
+        if self.COLOR_MODE != 'auto':
+            raise ValueError(f"Неизвестный режим цвета: {self.COLOR_MODE}")
         
-        self.logger.warning(f"⚠️ Шрифт не найден, используется стандартный PIL")
-        return ImageFont.load_default()
+        text_color = self.COLORS[color]['text_color']
+        if len(set(text_color)) == 1 and self.template_cache.is_grayscale(
+            template_path, size_px or self.WORKING_SIZE, care_type=care_type, color=color,
+            tolerance=self.GRAYSCALE_TOLERANCE
+        ):
+            return 'L'
+        return 'RGB'
 
-    def create_label_image(self, template_path, size, composition, color):
-        """Создаёт этикетку в высоком качестве - ВОЗВРАЩАЕТ ОБЪЕКТ Image"""
-        try:
-            self.logger.debug(f"Загрузка шаблона: {template_path}")
-            template = Image.open(template_path)
-            label = template.convert('RGB')
-            label = label.resize((self.WORKING_SIZE, self.WORKING_SIZE), Image.Resampling.LANCZOS)
-            self.logger.debug(f"Шаблон масштабирован до {self.WORKING_SIZE}x{self.WORKING_SIZE}")
-            
-            draw = ImageDraw.Draw(label)
-            text_color = self.COLORS[color]['text_color']
-            
-            # Загружаем шрифты
-            if size == 'ONE SIZE':
-                font_size = int(self.FONT_SIZES['size_small'])
-            else:
-                font_size = int(self.FONT_SIZES['size_large'])
-            
-            font_size_text = self.load_font(font_size)
-            font_composition = self.load_font(int(self.FONT_SIZES['composition']))
-            
-            # ==================== РАЗМЕР ====================
-            if size == 'ONE SIZE':
-                size_coords = self.COORDINATES['size_one_size']
-            else:
-                size_coords = self.COORDINATES['size']
-            
-            size_x = size_coords['x']
-            size_y = size_coords['y']
-            
-            if size == 'ONE SIZE':
-                draw.text((size_x, size_y), "ONE", fill=text_color, font=font_size_text)
-                line_spacing = int(self.FONT_SIZES['line_spacing_onesize'])
-                draw.text((size_x, size_y + line_spacing), "SIZE", fill=text_color, font=font_size_text)
-                self.logger.debug(f"Написан размер: ONE SIZE в позиции ({size_x}, {size_y})")
-            else:
-                draw.text((size_x, size_y), size, fill=text_color, font=font_size_text)
-                self.logger.debug(f"Написан размер: {size} в позиции ({size_x}, {size_y})")
-            
-            # ==================== СОСТАВ ВЕРТИКАЛЬНЫЙ (90° вправо) ====================
-            comp_coords = self.COORDINATES['composition']
-            
-            vert_width = self.COMPOSITION_BOX['width']
-            vert_height = self.COMPOSITION_BOX['height']
-            bg_color = (255, 255, 255) if text_color == (0, 0, 0) else (0, 0, 0)
-            
-            text_img = Image.new('RGB', (vert_width, vert_height), color=bg_color)
-            text_draw = ImageDraw.Draw(text_img)
-            
-            line_spacing = int(self.FONT_SIZES['line_spacing_composition'] * 1.5)
-            
-            # Заголовок и материалы
-            composition_text = self.parse_composition(composition)
-            text_draw.text((10, 10), "СОСТАВ:", fill=text_color, font=font_composition)
-            self.logger.debug(f"Написан заголовок: СОСТАВ:")
+    @staticmethod
+    def _fill(rgb, mode):
+        """Цвет заливки для режима изображения ('L'/'1' - яркость)"""
+        if mode == 'RGB':
+            return rgb
+        r, g, b = rgb
+        return round(0.299 * r + 0.587 * g + 0.114 * b)
+
+    def _composition_layer(self, composition_text, color, mode, layout, timings=None):
+        """Рисует вертикальную панель состава (уже повёрнутую на 90° вправо)"""
+        text_color = self._fill(self.COLORS[color]['text_color'], mode)
+        font_composition = self.load_font(layout['font_composition'])
+        
+        vert_width, vert_height = layout['composition_box']
+        bg_color = (255, 255, 255) if self.COLORS[color]['text_color'] == (0, 0, 0) else (0, 0, 0)
+        
+        text_img = Image.new(mode, (vert_width, vert_height), color=self._fill(bg_color, mode))
+        text_draw = ImageDraw.Draw(text_img)
+        
+        line_spacing = layout['line_spacing_composition']
+        padding = layout['composition_padding']
+        
+        # Заголовок и материалы
+        with stage_timer(timings, 'composition'):
+            self.glyph_atlas.draw_text(text_draw, (padding, padding), "СОСТАВ:", text_color, font_composition)
+            self.logger.debug("Написан заголовок: СОСТАВ:")
             
-            y_pos = 10 + line_spacing
+            y_pos = padding + line_spacing
             for i, material in enumerate(composition_text):
-                text_draw.text((10, y_pos), material, fill=text_color, font=font_composition)
-                self.logger.debug(f"Строка {i+1}: {material}")
+                self.glyph_atlas.draw_text(text_draw, (padding, y_pos), material, text_color, font_composition)
+                self.logger.debug("Строка %d: %s", i + 1, material)
                 y_pos += line_spacing
+        
+        # Поворот на 90° вправо
+        with stage_timer(timings, 'rotate'):
+            return text_img.rotate(-90, expand=True)
+
+    def _layered_base(self, template_path, composition, color, care_type, mode, size_px, layout,
+                      timings=None):
+        """Шаблон с уже вставленной панелью состава (из кэша слоёв)
+
+        Для режимов 'L' и '1' слой хранится в 8-bit сером.
+        """
+        layer_mode = 'RGB' if mode == 'RGB' else 'L'
+        composition_text = tuple(self.parse_composition(composition))
+        key = (
+            self.template_cache._make_key(template_path, size_px, care_type, color),
+            composition_text,
+            self.COLORS[color]['text_color'],
+            self.font_registry.path,
+            tuple(sorted(layout.items())),
+            layer_mode,
+        )
+        
+        def build():
+            base = self.template_cache.get(
+                template_path, size_px, care_type=care_type, color=color
+            )
+            if layer_mode != 'RGB':
+                base = base.convert(layer_mode)
+            # Вставляем повёрнутый текст с применённым смещением
+            panel = self._composition_layer(composition_text, color, layer_mode, layout, timings)
+            base.paste(panel, layout['composition'])
+            return base
+        
+        return self.layer_cache.get(key, build)
+
+    def create_label_image(self, template_path, size, composition, color, care_type=None, dpi=None,
+                           timings=None):
+        """Создаёт этикетку в высоком качестве - ВОЗВРАЩАЕТ ОБЪЕКТ Image
+
+        dpi - разрешение растра (по умолчанию RENDER_DPI / рабочий размер).
+        timings - словарь для длительностей этапов (см. RenderStats).
+        """
+        try:
+            self.logger.debug("Загрузка шаблона: %s", template_path)
+            size_px = self.render_size(dpi)
+            layout = self.layout_px(size_px)
             
-            # Поворот на 90° вправо
-            text_img_rotated = text_img.rotate(-90, expand=True)
+            # Шаблон + панель состава общие для всех размеров одного цвета.
+            # При промахе кэша слоёв composition и rotate замеряются внутри -
+            # вычитаем их из template, чтобы этапы не пересекались
+            nested = ('composition', 'rotate')
+            nested_before = sum(timings.get(stage, 0.0) for stage in nested) if timings is not None else 0.0
+            with stage_timer(timings, 'template'):
+                mode = self.label_mode(template_path, color, care_type=care_type, size_px=size_px)
+                label = self._layered_base(template_path, composition, color, care_type, mode, size_px,
+                                           layout, timings)
+            if timings is not None:
+                timings['template'] -= sum(timings.get(stage, 0.0) for stage in nested) - nested_before
             
-            # Вставляем повёрнутый текст с применённым смещением
-            vert_x = comp_coords['x']
-            vert_y = comp_coords['y']
-            label.paste(text_img_rotated, (vert_x, vert_y))
+            with stage_timer(timings, 'draw'):
+                draw = ImageDraw.Draw(label)
+                text_color = self._fill(self.COLORS[color]['text_color'], label.mode)
+                
+                # ==================== РАЗМЕР ====================
+                if size == 'ONE SIZE':
+                    font_size_text = self.load_font(layout['font_size_small'])
+                    size_x, size_y = layout['size_one_size']
+                    self.glyph_atlas.draw_text(draw, (size_x, size_y), "ONE", text_color, font_size_text)
+                    line_spacing = layout['line_spacing_onesize']
+                    self.glyph_atlas.draw_text(draw, (size_x, size_y + line_spacing), "SIZE", text_color,
+                                               font_size_text)
+                else:
+                    font_size_text = self.load_font(layout['font_size_large'])
+                    size_x, size_y = layout['size']
+                    self.glyph_atlas.draw_text(draw, (size_x, size_y), size, text_color, font_size_text)
+                self.logger.debug("Написан размер: %s в позиции (%s, %s)", size, size_x, size_y)
+                
+                if mode == '1':
+                    # Порог без дизеринга: чистые чёрные и белые пиксели
+                    label = label.point(lambda v: 255 if v >= 128 else 0).convert('1', dither=Image.Dither.NONE)
             
-            self.logger.info(f"✅ Этикетка создана (размер: {size}, цвет: {color})")
+            if self.LOG_MODE == 'detailed':
+                self.logger.info("✅ Этикетка создана (размер: %s, цвет: %s)", size, color)
             return label
             
         except FileNotFoundError as e:
-            self.logger.error(f"❌ Файл не найден: {e}")
+            self.logger.error("❌ Файл не найден: %s", e)
             return None
         except Exception as e:
-            self.logger.error(f"❌ Ошибка при создании этикетки: {e}", exc_info=True)
+            self.logger.error("❌ Ошибка при создании этикетки: %s", e, exc_info=True)
             return None
 
+    def preview_png(self, composition, care_type, size, color, dpi=None):
+        """Быстрый предпросмотр этикетки: PNG в низком разрешении, без PDF
+
+        Тот же create_label_image и та же раскладка, что и у итоговых PDF,
+        только растр PREVIEW_DPI. Возвращает байты PNG или None.
+        """
+        template_path = self.CARE_OPTIONS[care_type]['templates'].get(color)
+        if not template_path:
+            self.logger.warning(f"Шаблон для цвета '{color}' не найден")
+            return None
+        label = self.create_label_image(template_path, size, composition, color,
+                                        care_type=care_type, dpi=dpi or self.PREVIEW_DPI)
+        if label is None:
+            return None
+        buffer = io.BytesIO()
+        if not self.image_to_png(label, buffer):
+            return None
+        return buffer.getvalue()
+
     def image_to_png(self, image, output_path):
         """Преобразует PIL Image в PNG"""
         try:
-            self.logger.debug(f"Сохраняю PNG: {output_path}")
-            image.save(output_path, 'PNG', quality=100)
+            self.logger.debug("Сохраняю PNG: %s", output_path)
+            # PNG без потерь: режим 'L' -> 8-bit серый, '1' -> 1-bit
+            image.save(output_path, 'PNG')
             return True
         except Exception as e:
-            self.logger.error(f"❌ Ошибка при сохранении PNG: {e}")
+            self.logger.error("❌ Ошибка при сохранении PNG: %s", e)
             return False
 
+    def _draw_pdf(self, source, pdf_output):
+        """Рисует изображение на странице FINAL_SIZE_MM (source - путь или ImageReader)"""
+        page_size = self.FINAL_SIZE_MM * 2.834645669
+        c = load_reportlab().canvas.Canvas(pdf_output, pagesize=(page_size, page_size))
+        c.drawImage(source, 0, 0, width=page_size, height=page_size)
+        c.save()
+
     def png_to_pdf(self, png_path, pdf_output_path):
         """Преобразует PNG в высокое качество PDF (как изображение)"""
         try:
-            self.logger.debug(f"Начинаю сохранение PNG в PDF: {pdf_output_path}")
-            
-            c = rl_canvas.Canvas(
-                str(pdf_output_path), 
-                pagesize=(
-                    self.FINAL_SIZE_MM * 2.834645669,
-                    self.FINAL_SIZE_MM * 2.834645669
-                )
-            )
-            
-            c.drawImage(
-                str(png_path), 
-                0, 0,
-                width=self.FINAL_SIZE_MM * 2.834645669,
-                height=self.FINAL_SIZE_MM * 2.834645669
-            )
-            c.save()
-            self.logger.debug(f"✅ PDF сохранён: {pdf_output_path}")
+            self.logger.debug("Начинаю сохранение PNG в PDF: %s", pdf_output_path)
+            if self.PDF_WRITER == 'lean':
+                with Image.open(png_path) as png:
+                    Path(pdf_output_path).write_bytes(self.image_to_pdf_bytes(png))
+            else:
+                self._draw_pdf(str(png_path), str(pdf_output_path))
+            self.logger.debug("✅ PDF сохранён: %s", pdf_output_path)
             return True
             
         except Exception as e:
             self.logger.error(f"❌ Ошибка при преобразовании PNG в PDF: {e}", exc_info=True)
             return False
 
-    def generate_all_labels(self, composition, care_type, sizes=None, colors=None):
-        """Генирует все комбинации этикеток: PNG -> PDF"""
+    @staticmethod
+    def _pdf_image(image):
+        """ImageReader для reportlab: 'L' встраивается как DeviceGray
+
+        1-bit reportlab сам расширил бы до RGB, поэтому отдаём его как 8-bit
+        серый - Flate сжимает два уровня яркости почти так же хорошо.
+        """
+        if image.mode == '1':
+            image = image.convert('L')
+        return load_reportlab().ImageReader(image)
+
+    def image_to_pdf_bytes(self, image):
+        """Преобразует PIL Image в PDF целиком в памяти (без промежуточного PNG)"""
+        if self.PDF_WRITER == 'lean':
+            return image_pdf(image, self.FINAL_SIZE_MM * 2.834645669)
+        buffer = io.BytesIO()
+        self._draw_pdf(self._pdf_image(image), buffer)
+        return buffer.getvalue()
+
+    def image_to_pdf(self, image, pdf_output_path):
+        """Сохраняет PIL Image как PDF, минуя диск для промежуточных файлов"""
+        try:
+            self.logger.debug("Сохраняю PDF из памяти: %s", pdf_output_path)
+            pdf_bytes = self.image_to_pdf_bytes(image)
+            Path(pdf_output_path).write_bytes(pdf_bytes)
+            return True
+        except Exception as e:
+            self.logger.error(f"❌ Ошибка при сохранении PDF: {e}", exc_info=True)
+            return False
+
+    def _vector_renderer(self):
+        """Векторный backend (fontTools импортируется только при использовании)"""
+        from label_vector import VectorLabelRenderer
+        return VectorLabelRenderer(self)
+
+    def _render_job(self, job):
+        """Рендерит одну этикетку в PDF
+
+        Возвращает (имя файла, PDF или None, ошибка, {этап: секунды}).
+        """
+        filename_base, template_path, size, composition, color, care_type, png_path = job
+        timings = {}
+        if self.BACKEND == 'vector':
+            try:
+                with stage_timer(timings, 'pdf_encode'):
+                    pdf_bytes = self._vector_renderer().render_pdf(
+                        template_path, size, composition, color, care_type=care_type
+                    )
+                return filename_base, pdf_bytes, None, timings
+            except Exception as e:
+                self.logger.error("❌ Ошибка векторного рендера: %s", e, exc_info=True)
+                return filename_base, None, str(e), timings
+        
+        label = self.create_label_image(
+            template_path=template_path,
+            size=size,
+            composition=composition,
+            color=color,
+            care_type=care_type,
+            timings=timings
+        )
+        if label is None:
+            return filename_base, None, "не удалось создать изображение", timings
+        
+        if png_path is not None:
+            with stage_timer(timings, 'png'):
+                saved = self.image_to_png(label, png_path)
+            if saved and self.LOG_MODE == 'detailed':
+                self.logger.info("✅ PNG создана: %s.png", filename_base)
+        
+        try:
+            with stage_timer(timings, 'pdf_encode'):
+                pdf_bytes = self.image_to_pdf_bytes(label)
+            return filename_base, pdf_bytes, None, timings
+        except Exception as e:
+            self.logger.error("❌ Ошибка при создании PDF: %s", e, exc_info=True)
+            return filename_base, None, str(e), timings
+
+    def _run_jobs(self, jobs, workers):
+        """Выполняет задания с учётом кэша готовых PDF (порядок сохраняется)
+
+        Для этикеток из кэша словарь этапов пустой.
+        """
+        cache = self.output_cache
+        if cache is None:
+            yield from self._render_jobs(jobs, workers)
+            return
+        
+        keys = []
+        cached = []
+        for job in jobs:
+            filename_base, template_path, size, composition, color, care_type, png_path = job
+            key = None
+            data = None
+            # Отладочные PNG требуют настоящего рендера
+            if png_path is None:
+                try:
+                    key = self.output_cache_key(template_path, size, composition, color, care_type)
+                    data = cache.get(key)
+                except (OSError, ImportError) as e:
+                    self.logger.warning("⚠️ Кэш этикеток недоступен для %s: %s", filename_base, e)
+            keys.append(key)
+            cached.append(data)
+        
+        misses = [job for job, data in zip(jobs, cached) if data is None]
+        if len(misses) < len(jobs):
+            self.logger.info(f"💾 Из кэша: {len(jobs) - len(misses)} из {len(jobs)} этикеток")
+        rendered = self._render_jobs(misses, workers)
+        
+        for job, key, data in zip(jobs, keys, cached):
+            if data is not None:
+                yield job[0], data, None, {}
+                continue
+            result = next(rendered)
+            if key is not None and result[1] is not None:
+                try:
+                    cache.put(key, result[1])
+                except OSError as e:
+                    self.logger.warning("⚠️ Не удалось записать в кэш: %s", e)
+            yield result
+
+    def _render_jobs(self, jobs, workers):
+        """Выполняет задания последовательно или в пуле процессов (порядок сохраняется)"""
+        workers = min(workers, len(jobs))
+        if workers <= 1 or len(jobs) < PARALLEL_MIN_JOBS:
+            for job in jobs:
+                yield self._render_job(job)
+            return
+        
+        self.logger.info(f"⚙️ Параллельная генерация: {workers} процессов, {len(jobs)} этикеток")
+        # Прогретые кэши родителя достаются воркерам при fork без повторной загрузки
+        self.warm_caches()
+        chunksize = max(1, len(jobs) // (workers * 4))
+        log_queue = multiprocessing.Queue()
+        log_listener = logging.handlers.QueueListener(log_queue, _ForwardToLogger())
+        log_listener.start()
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(self, log_queue, logging.getLogger().getEffectiveLevel())) as pool:
+                yield from pool.map(_run_worker_job, jobs, chunksize=chunksize)
+        finally:
+            # Воркеры завершены - всё, что они записали, уже в очереди
+            log_listener.stop()
+            log_queue.close()
+
+    def _iter_results(self, composition, care_type, sizes, colors, workers, png_folder=None):
+        """Результаты по каждой этикетке: (имя без расширения, PDF или None, ошибка, этапы)"""
+        if workers is None:
+            workers = self.WORKERS
+        if not workers:
+            workers = os.cpu_count() or 1
+        
+        care_templates = self.CARE_OPTIONS[care_type]['templates']
+        
+        jobs = []
+        for size in sizes:
+            for color in colors:
+                color_name = self.COLORS[color]['name']
+                filename_base = f"{composition}_{size}_{color_name}"
+                template_path = care_templates.get(color)
+                if not template_path:
+                    self.logger.warning(f"Шаблон для цвета '{color}' не найден")
+                    yield filename_base, None, f"шаблон для цвета '{color}' не найден", {}
+                    continue
+                
+                png_path = str(png_folder / f"{filename_base}.png") if png_folder else None
+                jobs.append((filename_base, template_path, size, composition, color, care_type, png_path))
+        
+        yield from self._run_jobs(jobs, workers)
+
+    def _record_result(self, filename_base, pdf_bytes, error, timings, stats, on_stats):
+        """Учитывает результат этикетки в статистике и логе"""
+        # Этикетка из кэша готовых PDF не проходит этап сборки PDF
+        cached = pdf_bytes is not None and 'pdf_encode' not in timings
+        if stats is not None:
+            stats.add_timings(timings)
+            stats.count('labels' if pdf_bytes is not None else 'errors')
+            if pdf_bytes is not None:
+                stats.count('pdf_bytes', len(pdf_bytes))
+                stats.count('output_cache_hits' if cached else 'rendered')
+        if on_stats is not None:
+            on_stats(filename_base, timings)
+        
+        if pdf_bytes is None:
+            self.logger.error("❌ Этикетка не создана: %s (%s)", filename_base, error)
+        elif self.LOG_MODE == 'summary':
+            # Одна строка на этикетку вместо подробного лога каждого шага
+            self.logger.info("✅ %s: %.1f мс%s", filename_base, sum(timings.values()) * 1000,
+                             " (кэш)" if cached else "")
+
+    def iter_labels(self, composition, care_type, sizes=None, colors=None, workers=None,
+                    on_progress=None, stats=None, on_stats=None):
+        """Отдаёт готовые этикетки по мере создания: (имя файла, байты PDF)
+
+        Ничего не пишет на диск. on_progress(готово, всего) вызывается после
+        каждой этикетки, включая неудачные. stats - RenderStats для таймингов,
+        on_stats(имя, {этап: секунды}) вызывается для каждой этикетки.
+        """
+        if sizes is None:
+            sizes = self.SIZES
+        if colors is None:
+            colors = list(self.COLORS.keys())
+        
+        total = len(sizes) * len(colors)
+        done = 0
+        results = self._iter_results(composition, care_type, sizes, colors, workers)
+        for filename_base, pdf_bytes, error, timings in results:
+            done += 1
+            self._record_result(filename_base, pdf_bytes, error, timings, stats, on_stats)
+            if on_progress is not None:
+                on_progress(done, total)
+            if pdf_bytes is None:
+                continue
+            yield f"{filename_base}.pdf", pdf_bytes
+
+    def generate_all_labels(self, composition, care_type, sizes=None, colors=None,
+                            debug_png=False, workers=None, stats=None, on_stats=None,
+                            output_dir=None):
+        """Генирует все комбинации этикеток: Image -> PDF в памяти
+
+        debug_png=True дополнительно сохраняет PNG в папку _temp_png (для отладки).
+        workers - число процессов (по умолчанию self.WORKERS, None/0 - все ядра).
+        stats / on_stats - тайминги этапов, как в iter_labels.
+        output_dir - папка для этого вызова (по умолчанию self.output_dir).
+        """
         if sizes is None:
             sizes = self.SIZES
         if colors is None:
@@ -337,83 +1453,203 @@ class LabelGenerator:
         self.logger.info(f"Размеры: {', '.join(sizes)}")
         self.logger.info(f"Цвета: {', '.join([self.COLORS[c]['name'] for c in colors])}")
         
-        composition_folder = self.output_dir / composition
-        composition_folder.mkdir(exist_ok=True)
+        composition_folder = Path(output_dir or self.output_dir) / composition
+        composition_folder.mkdir(parents=True, exist_ok=True)
         
-        # Папка для временных PNG файлов
-        png_temp_folder = composition_folder / "_temp_png"
-        png_temp_folder.mkdir(exist_ok=True)
+        # Папка для отладочных PNG файлов (только по запросу)
+        png_debug_folder = None
+        if debug_png:
+            png_debug_folder = composition_folder / "_temp_png"
+            png_debug_folder.mkdir(exist_ok=True)
         
         generated_count = 0
         error_count = 0
         
-        care_templates = self.CARE_OPTIONS[care_type]['templates']
+        self.logger.info("=" * 70)
+        self.logger.info("Создание PIL-изображений и запись PDF")
+        self.logger.info("=" * 70)
+        
+        results = self._iter_results(composition, care_type, sizes, colors, workers, png_debug_folder)
+        for filename_base, pdf_bytes, error, timings in results:
+            pdf_filename = f"{filename_base}.pdf"
+            if pdf_bytes is not None:
+                try:
+                    with stage_timer(timings, 'pdf_write'):
+                        (composition_folder / pdf_filename).write_bytes(pdf_bytes)
+                except OSError as e:
+                    self.logger.error("❌ Ошибка при сохранении PDF: %s", e)
+                    pdf_bytes, error = None, str(e)
+            
+            self._record_result(filename_base, pdf_bytes, error, timings, stats, on_stats)
+            if pdf_bytes is None:
+                error_count += 1
+                continue
+            if self.LOG_MODE == 'detailed':
+                self.logger.info("✅ PDF создана: %s", pdf_filename)
+            generated_count += 1
         
         self.logger.info("=" * 70)
-        self.logger.info("ЭТАП 1: Создание PIL-изображений и сохранение как PNG")
+        self.logger.info(f"Генерация завершена! ✅ {generated_count} | ❌ {error_count}")
+        if stats is not None:
+            for stage, values in stats.as_dict()['stages'].items():
+                self.logger.info("⏱️ %s: %.1f мс (%d)", stage, values['seconds'] * 1000, values['calls'])
         self.logger.info("=" * 70)
         
-        # ЭТАП 1: Создаём все варианты этикеток как PNG
-        png_files = []
-        for size in sizes:
+        return generated_count
+
+    def _imposition_grid(self, layout, total):
+        """Считает сетку раскладки: (ширина, высота страницы в pt, колонки, строки)"""
+        cell = self.FINAL_SIZE_MM + 2 * layout['bleed_mm']
+        pitch = cell + layout['gap_mm']
+        margin = layout['margin_mm']
+        
+        if layout['page'] == 'roll':
+            page_w = layout['roll_width_mm']
+        elif layout['page'] == 'A4':
+            page_w = 210
+        else:
+            raise ValueError(f"Неизвестный формат листа: {layout['page']}")
+        
+        columns = layout['columns'] or int((page_w - 2 * margin + layout['gap_mm']) // pitch)
+        if columns < 1:
+            raise ValueError(f"Этикетка не помещается на лист шириной {page_w} мм")
+        
+        if layout['page'] == 'roll':
+            rows = layout['rows'] or min(10, -(-total // columns))
+            page_h = 2 * margin + rows * pitch - layout['gap_mm']
+        else:
+            page_h = 297
+            rows = layout['rows'] or int((page_h - 2 * margin + layout['gap_mm']) // pitch)
+            if rows < 1:
+                raise ValueError("Этикетка не помещается на лист A4")
+        
+        return page_w * mm, page_h * mm, columns, rows
+
+    def _draw_cut_marks(self, c, x, y, size, layout):
+        """Рисует метки реза по углам этикетки (x, y - левый нижний угол обреза)"""
+        offset = layout['bleed_mm'] * mm
+        length = layout['mark_length_mm'] * mm
+        c.setLineWidth(0.25)
+        c.setStrokeColorRGB(0, 0, 0)
+        for cx in (x, x + size):
+            for cy in (y, y + size):
+                dx = -1 if cx == x else 1
+                dy = -1 if cy == y else 1
+                c.line(cx + dx * offset, cy, cx + dx * (offset + length), cy)
+                c.line(cx, cy + dy * offset, cx, cy + dy * (offset + length))
+
+    def write_imposed_pdf(self, labels, pdf_output, layout=None):
+        """Раскладывает этикетки по страницам
+
+        labels - список (имя, Image, количество). Каждое изображение встраивается
+        в PDF один раз (Form XObject) и переиспользуется на всех страницах.
+        Возвращает количество размещённых этикеток.
+        """
+        layout = {**self.IMPOSITION, **(layout or {})}
+        total = sum(quantity for _, _, quantity in labels)
+        page_w, page_h, columns, rows = self._imposition_grid(layout, max(total, 1))
+        
+        label_size = self.FINAL_SIZE_MM * mm
+        bleed = layout['bleed_mm'] * mm
+        pitch = label_size + 2 * bleed + layout['gap_mm'] * mm
+        margin = layout['margin_mm'] * mm
+        per_page = columns * rows
+        
+        c = load_reportlab().canvas.Canvas(pdf_output, pagesize=(page_w, page_h))
+        
+        # Каждая уникальная этикетка - одна форма на весь документ
+        for index, (name, image, _) in enumerate(labels):
+            cell = label_size + 2 * bleed
+            c.beginForm(f"label{index}", 0, 0, cell, cell)
+            if bleed:
+                bg = image.convert('RGB').getpixel((0, 0))
+                c.setFillColorRGB(*(v / 255 for v in bg))
+                c.rect(0, 0, cell, cell, stroke=0, fill=1)
+            c.drawImage(self._pdf_image(image), bleed, bleed, width=label_size, height=label_size)
+            c.endForm()
+        
+        placed = 0
+        for index, (name, image, quantity) in enumerate(labels):
+            for _ in range(quantity):
+                slot = placed % per_page
+                if slot == 0 and placed:
+                    c.showPage()
+                    c.setPageSize((page_w, page_h))
+                column = slot % columns
+                row = slot // columns
+                x = margin + column * pitch
+                y = page_h - margin - row * pitch - (label_size + 2 * bleed)
+                c.saveState()
+                c.translate(x, y)
+                c.doForm(f"label{index}")
+                c.restoreState()
+                if layout['cut_marks']:
+                    self._draw_cut_marks(c, x + bleed, y + bleed, label_size, layout)
+                placed += 1
+        
+        c.save()
+        self.logger.info(f"🖨️ Раскладка: {placed} этикеток, {columns}x{rows} на странице, "
+                         f"страниц: {-(-placed // per_page) if placed else 0}")
+        return placed
+
+    def generate_imposed_pdf(self, composition, care_type, quantities=None, colors=None,
+                             layout=None, pdf_output_path=None, failures=None):
+        """Создаёт один многостраничный PDF для типографии
+
+        quantities - {размер: количество} (или одно число для всех размеров),
+        по умолчанию - по одной этикетке каждого размера.
+        pdf_output_path - путь или файловый объект (например, io.BytesIO).
+        failures - список, куда добавляются пропущенные этикетки
+        {'size', 'color', 'error'} (лист собирается из остальных).
+        """
+        if quantities is None:
+            quantities = {size: 1 for size in self.SIZES}
+        elif isinstance(quantities, int):
+            quantities = {size: quantities for size in self.SIZES}
+        if colors is None:
+            colors = list(self.COLORS.keys())
+        
+        care_templates = self.CARE_OPTIONS[care_type]['templates']
+        labels = []
+        for size, quantity in quantities.items():
+            if quantity <= 0:
+                continue
             for color in colors:
                 template_path = care_templates.get(color)
                 if not template_path:
                     self.logger.warning(f"Шаблон для цвета '{color}' не найден")
-                    error_count += 1
+                    if failures is not None:
+                        failures.append({'size': size, 'color': color, 'error': "шаблон не найден"})
                     continue
-                
-                # Создаём PIL-изображение
                 label = self.create_label_image(
                     template_path=template_path,
                     size=size,
                     composition=composition,
-                    color=color
+                    color=color,
+                    care_type=care_type
                 )
-                
                 if label is None:
-                    error_count += 1
+                    if failures is not None:
+                        failures.append({'size': size, 'color': color, 'error': "не удалось создать изображение"})
                     continue
-                
-                color_name = self.COLORS[color]['name']
-                filename_base = f"{composition}_{size}_{color_name}"
-                png_path = png_temp_folder / f"{filename_base}.png"
-                
-                # Сохраняем как PNG
-                if self.image_to_png(label, str(png_path)):
-                    png_files.append((png_path, filename_base))
-                    self.logger.info(f"✅ PNG создана: {filename_base}.png")
-                else:
-                    error_count += 1
+                labels.append((f"{size}_{color}", label, quantity))
         
-        self.logger.info("=" * 70)
-        self.logger.info("ЭТАП 2: Преобразование PNG -> PDF")
-        self.logger.info("=" * 70)
+        if not labels:
+            self.logger.error("❌ Нет этикеток для раскладки")
+            return 0
         
-        # ЭТАП 2: Преобразуем все PNG в PDF
-        for png_path, filename_base in png_files:
-            pdf_filename = f"{filename_base}.pdf"
-            pdf_output_path = composition_folder / pdf_filename
-            
-            if self.png_to_pdf(str(png_path), str(pdf_output_path)):
-                self.logger.info(f"✅ PDF создана: {pdf_filename}")
-                generated_count += 1
-            else:
-                error_count += 1
+        if pdf_output_path is None:
+            composition_folder = self.output_dir / composition
+            composition_folder.mkdir(parents=True, exist_ok=True)
+            pdf_output_path = composition_folder / f"{composition}_печать.pdf"
         
-        # Удаляем временную папку с PNG
         try:
-            import shutil
-            shutil.rmtree(png_temp_folder)
-            self.logger.debug("Временная папка с PNG удалена")
+            if not hasattr(pdf_output_path, 'write'):
+                pdf_output_path = str(pdf_output_path)
+            return self.write_imposed_pdf(labels, pdf_output_path, layout=layout)
         except Exception as e:
-            self.logger.warning(f"Не удалось удалить временную папку: {e}")
-        
-        self.logger.info("=" * 70)
-        self.logger.info(f"Генерация завершена! ✅ {generated_count} | ❌ {error_count}")
-        self.logger.info("=" * 70)
-        
-        return generated_count
+            self.logger.error(f"❌ Ошибка при раскладке на лист: {e}", exc_info=True)
+            return 0
 
     def run_interactive(self):
         """Интерактивный режим программы"""
@@ -472,8 +1708,8 @@ def main():
     logger.info("║ ║")
     logger.info("║ ✅ ИСПРАВЛЕНО: ║")
     logger.info("║ - Сначала создаются все варианты (PIL Image) ║")
-    logger.info("║ - Затем сохраняются как PNG (текст растеризуется) ║")
-    logger.info("║ - Потом PNG преобразуется в PDF как изображение ║")
+    logger.info("║ - Текст растеризуется прямо в изображении ║")
+    logger.info("║ - Изображение записывается в PDF из памяти ║")
     logger.info("║ - Готов к печати без проблем с текстовыми слоями! ║")
     logger.info("╚════════════════════════════════════════════════════════════════════════╝")
     
@@ -0,0 +1,310 @@
+"""
+Проверка этикеток herself19 по эталонным изображениям (golden images)
+
+Рендерит полную матрицу: фиксированные составы × CARE_OPTIONS × COLORS ×
+SIZES - и сравнивает каждую этикетку с эталоном, сохранённым заранее
+(например, с последнего проверенного коммита).
+
+Эталоны хранятся отдельно для каждого размера растра (папка <размер>px,
+раздел манифеста с тем же ключом) и сравниваются только в том же
+разрешении: рендер 300 dpi сверяется с эталоном 300 dpi, без ресемплинга.
+
+Сравнение в три ступени, от быстрой к подробной:
+1. SHA-256 пикселей против манифеста - совпало, эталон даже не читается;
+2. перцептивные хэши (aHash / dHash, 64 бита) - ловят сдвиги и пропажу текста;
+3. попиксельная разница с допуском: доля пикселей, отличающихся больше
+   порога яркости.
+
+При ошибке в папку --diff-dir пишутся новое изображение и карта отличий
+(красным поверх приглушённого эталона). Так можно включать оптимизации
+(кэши, другое разрешение, атлас глифов, другой PDF-backend) и сразу
+видеть, сдвинулось ли что-нибудь.
+
+Примеры:
+    python label_golden.py save --refs golden_refs
+    python label_golden.py save --refs golden_refs --dpi 300
+    python label_golden.py check --refs golden_refs
+    python label_golden.py check --refs golden_refs --dpi 300
+    python label_golden.py check --refs golden_refs --pdf --backend vector
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image, ImageChops
+
+from label_final import LabelGenerator, setup_logging
+
+try:
+    import pymupdf
+except ImportError:
+    pymupdf = None
+
+# Фиксированные составы: короткий, длинный и без нормализации регистра/пробелов
+COMPOSITIONS = [
+    "95% Хлопок, 5% Эластан",
+    "40% Шерсть, 30% Вискоза, 20% Полиэстер, 5% Кашемир, 5% Эластан",
+    "70%вискоза,  30% ПОЛИАМИД",
+]
+
+
+def average_hash(image):
+    """aHash: 8x8 в оттенках серого, бит - ярче среднего"""
+    pixels = image.convert('L').resize((8, 8), Image.Resampling.BOX).tobytes()
+    mean = sum(pixels) / len(pixels)
+    return sum(1 << i for i, value in enumerate(pixels) if value > mean)
+
+
+def difference_hash(image):
+    """dHash: 9x8 в оттенках серого, бит - яркость растёт слева направо"""
+    pixels = image.convert('L').resize((9, 8), Image.Resampling.BOX).tobytes()
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            if pixels[row * 9 + col] < pixels[row * 9 + col + 1]:
+                bits |= 1 << (row * 8 + col)
+    return bits
+
+
+def pixel_digest(image):
+    return hashlib.sha256(image.mode.encode('ascii') + image.tobytes()).hexdigest()
+
+
+def label_matrix(generator):
+    """Все комбинации: (имя, путь шаблона, размер, состав, цвет, уход)"""
+    for index, composition in enumerate(COMPOSITIONS):
+        for care_type, care in generator.CARE_OPTIONS.items():
+            for color, template_path in care['templates'].items():
+                for size in generator.SIZES:
+                    name = f"{index}_{care_type}_{color}_{size.replace(' ', '_')}"
+                    yield name, template_path, size, composition, color, care_type
+
+
+def _rasterize_pdf(pdf_bytes, size_px):
+    """Первая страница PDF в RGB нужного размера (требуется pymupdf)"""
+    document = pymupdf.open(stream=pdf_bytes, filetype='pdf')
+    page = document[0]
+    zoom = size_px / page.rect.width
+    pixmap = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+    image = Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+    document.close()
+    return image
+
+
+def render_matrix(generator, pdf=False, size_px=None):
+    """Рендерит матрицу: {имя: Image}. pdf=True - через PDF и растеризацию"""
+    if not pdf:
+        return {
+            name: generator.create_label_image(template_path, size, composition, color, care_type=care_type)
+            for name, template_path, size, composition, color, care_type in label_matrix(generator)
+        }
+
+    if pymupdf is None:
+        raise ImportError("Для проверки PDF установите: pip install pymupdf")
+    images = {}
+    for name, template_path, size, composition, color, care_type in label_matrix(generator):
+        job = (name, template_path, size, composition, color, care_type, None)
+        _, pdf_bytes, error, _ = generator._render_job(job)
+        if pdf_bytes is None:
+            raise RuntimeError(f"{name}: {error}")
+        images[name] = _rasterize_pdf(pdf_bytes, size_px or generator.render_size())
+    return images
+
+
+def _load_manifest(refs_dir):
+    path = Path(refs_dir) / 'manifest.json'
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding='utf-8'))
+
+
+def save_references(generator, refs_dir):
+    """Сохраняет эталоны текущего размера растра (PNG без потерь) и их хэши
+
+    Эталоны других размеров в манифесте остаются.
+    """
+    refs_dir = Path(refs_dir)
+    size_px = generator.render_size()
+    size_dir = refs_dir / f"{size_px}px"
+    size_dir.mkdir(parents=True, exist_ok=True)
+    manifest = _load_manifest(refs_dir)
+    if manifest is None or manifest['compositions'] != COMPOSITIONS:
+        manifest = {'compositions': COMPOSITIONS, 'renders': {}}
+    labels = manifest['renders'][str(size_px)] = {}
+    for name, image in render_matrix(generator).items():
+        image.save(size_dir / f"{name}.png")
+        labels[name] = {
+            'size': list(image.size),
+            'mode': image.mode,
+            'sha256': pixel_digest(image),
+            'ahash': f"{average_hash(image):016x}",
+            'dhash': f"{difference_hash(image):016x}",
+        }
+    (refs_dir / 'manifest.json').write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding='utf-8')
+    return len(labels)
+
+
+def _channel_max_difference(a, b):
+    """Карта отличий 'L': максимум разницы по каналам RGB"""
+    r, g, b = ImageChops.difference(a.convert('RGB'), b.convert('RGB')).split()
+    return ImageChops.lighter(ImageChops.lighter(r, g), b)
+
+
+def _diff_image(reference, difference, threshold):
+    """Приглушённый эталон, отличающиеся пиксели - красным"""
+    base = reference.convert('L').point(lambda v: 128 + v // 2).convert('RGB')
+    mask = difference.point(lambda v: 255 if v > threshold else 0)
+    base.paste((255, 0, 0), mask=mask)
+    return base
+
+
+def compare_label(image, reference, expected, pixel_threshold, tolerance, hash_distance):
+    """Сравнение одной этикетки: dict с метриками и статусом"""
+    if list(image.size) == expected['size'] and image.mode == expected['mode'] \
+            and pixel_digest(image) == expected['sha256']:
+        return {'status': 'identical'}
+
+    if image.size != reference.size:
+        return {'status': 'failed', 'error': f"размер {image.size} вместо {reference.size}"}
+
+    ahash = bin(average_hash(image) ^ int(expected['ahash'], 16)).count('1')
+    dhash = bin(difference_hash(image) ^ int(expected['dhash'], 16)).count('1')
+    difference = _channel_max_difference(image, reference)
+    histogram = difference.histogram()
+    changed = sum(histogram[pixel_threshold + 1:])
+    ratio = changed / (reference.width * reference.height)
+    max_diff = max((value for value, count in enumerate(histogram) if count), default=0)
+
+    ok = ahash <= hash_distance and dhash <= hash_distance and ratio <= tolerance
+    return {
+        'status': 'close' if ok else 'failed',
+        'ahash_distance': ahash,
+        'dhash_distance': dhash,
+        'changed_ratio': round(ratio, 6),
+        'max_diff': max_diff,
+        '_difference': difference,
+        '_image': image,
+    }
+
+
+def check_references(generator, refs_dir, diff_dir, pdf=False, pixel_threshold=32,
+                     tolerance=0.001, hash_distance=4):
+    """Сравнивает текущий рендер с эталонами, возвращает отчёт"""
+    refs_dir = Path(refs_dir)
+    manifest = _load_manifest(refs_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"нет эталонов в {refs_dir} - создайте их командой save")
+    if manifest['compositions'] != COMPOSITIONS:
+        raise ValueError("эталоны сняты с другими составами - пересоздайте их командой save")
+    size_px = generator.render_size()
+    labels = manifest['renders'].get(str(size_px))
+    if labels is None:
+        raise ValueError(f"нет эталонов для растра {size_px}px - сохраните их: save с тем же --dpi")
+    size_dir = refs_dir / f"{size_px}px"
+
+    started = time.perf_counter()
+    images = render_matrix(generator, pdf=pdf, size_px=size_px)
+    render_seconds = time.perf_counter() - started
+
+    results = {}
+    for name, expected in labels.items():
+        image = images.get(name)
+        if image is None:
+            results[name] = {'status': 'failed', 'error': "этикетка не создана"}
+            continue
+        reference = None
+        if pixel_digest(image) != expected['sha256']:
+            with Image.open(size_dir / f"{name}.png") as ref_file:
+                reference = ref_file.copy()
+        result = compare_label(image, reference, expected, pixel_threshold, tolerance, hash_distance)
+        difference = result.pop('_difference', None)
+        candidate = result.pop('_image', None)
+        if result['status'] == 'failed' and difference is not None and diff_dir:
+            diff_dir = Path(diff_dir)
+            diff_dir.mkdir(parents=True, exist_ok=True)
+            candidate.save(diff_dir / f"{name}_new.png")
+            _diff_image(reference, difference, pixel_threshold).save(diff_dir / f"{name}_diff.png")
+        results[name] = result
+
+    counts = {}
+    for result in results.values():
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    return {
+        'render_size': size_px,
+        'labels': len(results),
+        'counts': counts,
+        'render_seconds': round(render_seconds, 3),
+        'total_seconds': round(time.perf_counter() - started, 3),
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Проверка этикеток по эталонным изображениям")
+    parser.add_argument('command', choices=['save', 'check'])
+    parser.add_argument('--refs', default='golden_refs', help="папка эталонов")
+    parser.add_argument('--diff-dir', default='golden_diff', help="куда писать изображения отличий")
+    parser.add_argument('--pixel-threshold', type=int, default=32,
+                        help="разница яркости, с которой пиксель считается изменённым (0-255)")
+    parser.add_argument('--tolerance', type=float, default=0.001,
+                        help="допустимая доля изменённых пикселей")
+    parser.add_argument('--hash-distance', type=int, default=4,
+                        help="допустимое расстояние Хэмминга aHash/dHash (из 64 бит)")
+    parser.add_argument('--pdf', action='store_true', help="проверять PDF (растеризация через pymupdf)")
+    parser.add_argument('--dpi', type=int, help="разрешение растра этикетки (эталоны - отдельно для каждого)")
+    parser.add_argument('--color-mode', choices=['auto', 'rgb', 'gray', '1bit'])
+    parser.add_argument('--backend', choices=['raster', 'vector'])
+    parser.add_argument('--pdf-writer', choices=['lean', 'reportlab'])
+    parser.add_argument('--template-pack', help="пакет шаблонов (label_pack.py)")
+    parser.add_argument('--report', help="записать отчёт в JSON")
+    args = parser.parse_args(argv)
+
+    setup_logging(level=logging.WARNING)
+    generator = LabelGenerator()
+    if args.backend:
+        generator.BACKEND = args.backend
+    if args.pdf_writer:
+        generator.PDF_WRITER = args.pdf_writer
+    if args.color_mode:
+        generator.COLOR_MODE = args.color_mode
+    if args.dpi:
+        generator.RENDER_DPI = args.dpi
+    if args.template_pack:
+        generator.use_template_pack(args.template_pack)
+
+    if args.command == 'save':
+        count = save_references(generator, args.refs)
+        print(f"✅ Эталонов сохранено: {count} ({generator.render_size()}px) -> {args.refs}")
+        return 0
+
+    try:
+        report = check_references(
+            generator, args.refs, args.diff_dir, pdf=args.pdf or args.backend == 'vector',
+            pixel_threshold=args.pixel_threshold, tolerance=args.tolerance, hash_distance=args.hash_distance,
+        )
+    except (FileNotFoundError, ValueError) as e:
+        print(f"❌ {e}")
+        return 2
+    for name, result in report['results'].items():
+        if result['status'] != 'identical':
+            details = ', '.join(f"{k}={v}" for k, v in result.items() if k != 'status')
+            print(f"{'❌' if result['status'] == 'failed' else '≈ '} {name}: {details}")
+    print(f"Этикеток: {report['labels']} ({report['render_size']}px) {report['counts']} "
+          f"(рендер {report['render_seconds']} с, всего {report['total_seconds']} с)")
+    if args.report:
+        Path(args.report).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+
+    if report['counts'].get('failed'):
+        print(f"❌ Есть отличия, изображения: {args.diff_dir}")
+        return 1
+    print("✅ Совпадает с эталонами")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+"""
+Пакет шаблонов herself19: заранее подготовленные растры для воркеров
+
+Сборка декодирует JPEG-шаблоны (Group-305…308.jpg) один раз и сохраняет
+несжатые RGBX-буферы для каждого нужного разрешения в один файл.
+Воркеры и экземпляры сервиса открывают файл через mmap и оборачивают
+буферы в Image.frombuffer без копирования и декодирования: страницы
+файла общие для всех процессов хоста (page cache).
+
+Формат файла:
+    MAGIC (8 байт) | длина заголовка (uint64 LE) | заголовок JSON |
+    выравнивание до PAGE | данные (буферы, каждый с выравниванием ALIGN)
+
+Заголовок: версия рендера и Pillow, записи шаблонов (вариант ухода, цвет,
+путь, SHA-256 исходного файла, размер, смещение), метаданные шрифта и
+content_hash - SHA-256 данных и описания записей.
+
+Примеры:
+    python label_pack.py build templates.pack --dpi 203 --dpi 300
+    python label_pack.py info templates.pack
+    python label_pack.py verify templates.pack
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from pathlib import Path
+
+import PIL
+from PIL import Image
+
+from label_final import RENDER_VERSION, LabelGenerator, decode_template, file_digest, setup_logging
+
+MAGIC = b'H19TPK01'
+PAGE = 4096
+ALIGN = 64
+
+
+def _align(value, alignment):
+    return (value + alignment - 1) // alignment * alignment
+
+
+def _content_hash(entries, font, data):
+    """SHA-256 описания записей, шрифта и данных"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps({'entries': entries, 'font': font}, sort_keys=True).encode('utf-8'))
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def pack_sizes(generator, dpis=None):
+    """Стороны растра для пакета: рабочий размер, предпросмотр и DPI принтеров"""
+    sizes = {generator.render_size(), generator.render_size(generator.PREVIEW_DPI)}
+    for dpi in dpis or ():
+        sizes.add(generator.render_size(dpi))
+    return sorted(sizes)
+
+
+def font_metadata(generator, sizes):
+    """Шрифт пакета: путь, хэш, имя и метрики кеглей раскладки"""
+    path = generator.font_registry.path
+    metadata = {'path': path, 'sha256': file_digest(path) if path else None, 'metrics': {}}
+    if path is None:
+        return metadata
+    metadata['name'] = list(generator.load_font(generator.FONT_SIZES['size_large']).getname())
+    for size_px in sizes:
+        layout = generator.layout_px(size_px)
+        for key in ('font_size_large', 'font_size_small', 'font_composition'):
+            ascent, descent = generator.load_font(layout[key]).getmetrics()
+            metadata['metrics'][str(layout[key])] = [ascent, descent]
+    return metadata
+
+
+def build_pack(generator, output_path, dpis=None):
+    """Собирает пакет шаблонов всех CARE_OPTIONS, возвращает заголовок"""
+    logger = logging.getLogger(__name__)
+    sizes = pack_sizes(generator, dpis)
+
+    entries = []
+    buffers = []
+    offset = 0
+    for care_type, care in generator.CARE_OPTIONS.items():
+        for color, template_path in care['templates'].items():
+            source_digest = file_digest(template_path)
+            for size_px in sizes:
+                # RGBX совпадает с внутренним форматом RGB в Pillow (4 байта на пиксель):
+                # такой буфер frombuffer отображает без копирования
+                image = decode_template(template_path, size_px).convert('RGBX')
+                raw = image.tobytes()
+                offset = _align(offset, ALIGN)
+                entries.append({
+                    'care_type': care_type,
+                    'color': color,
+                    'template': str(template_path),
+                    'source_sha256': source_digest,
+                    'size': size_px,
+                    'mode': image.mode,
+                    'offset': offset,
+                    'length': len(raw),
+                })
+                buffers.append((offset, raw))
+                offset += len(raw)
+                logger.info(f"📦 {template_path} -> {size_px}x{size_px}")
+
+    data = bytearray(offset)
+    for start, raw in buffers:
+        data[start:start + len(raw)] = raw
+
+    font = font_metadata(generator, sizes)
+    header = {
+        'render_version': RENDER_VERSION,
+        'pillow': PIL.__version__,
+        'sizes': sizes,
+        'entries': entries,
+        'font': font,
+        'content_hash': _content_hash(entries, font, data),
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    data_start = _align(len(MAGIC) + 8 + len(header_bytes), PAGE)
+
+    # Атомарная запись: работающие воркеры продолжают читать старый файл
+    output_path = Path(output_path)
+    fd, tmp_path = tempfile.mkstemp(dir=output_path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<Q', len(header_bytes)))
+            f.write(header_bytes)
+            f.write(b'\0' * (data_start - f.tell()))
+            f.write(data)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    logger.info(f"✅ Пакет шаблонов: {output_path} ({data_start + len(data)} байт, "
+                f"хэш {header['content_hash'][:12]})")
+    return header
+
+
+class TemplatePack:
+    """Открытый через mmap пакет шаблонов (только чтение)"""
+
+    def __init__(self, path):
+        self.logger = logging.getLogger(__name__)
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"не пакет шаблонов: {self.path}")
+        (header_length,) = struct.unpack_from('<Q', self._mmap, len(MAGIC))
+        header_start = len(MAGIC) + 8
+        self.header = json.loads(self._mmap[header_start:header_start + header_length].decode('utf-8'))
+        self._data_start = _align(header_start + header_length, PAGE)
+        self._entries = {(e['template'], e['size']): e for e in self.header['entries']}
+        self._stale = set()
+
+    def __getstate__(self):
+        # В процессы-воркеры (spawn) передаётся только путь
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    @property
+    def content_hash(self):
+        return self.header['content_hash']
+
+    def compatible(self):
+        """Собран той же версией рендера и Pillow (иначе растры могут отличаться)"""
+        return (self.header['render_version'] == RENDER_VERSION
+                and self.header['pillow'] == PIL.__version__)
+
+    def get(self, template_path, working_size):
+        """Шаблон без копирования (Image поверх mmap) или None, если его нет или он устарел"""
+        entry = self._entries.get((str(template_path), working_size))
+        if entry is None:
+            return None
+        if entry['source_sha256'] != file_digest(template_path):
+            if entry['template'] not in self._stale:
+                self._stale.add(entry['template'])
+                self.logger.warning(f"⚠️ Шаблон изменился после сборки пакета: {template_path}")
+            return None
+        start = self._data_start + entry['offset']
+        view = memoryview(self._mmap)[start:start + entry['length']]
+        size = (entry['size'], entry['size'])
+        return Image.frombuffer(entry['mode'], size, view, 'raw', entry['mode'], 0, 1)
+
+    def verify(self):
+        """Пересчитывает content_hash по данным файла"""
+        data = self._mmap[self._data_start:]
+        end = max((e['offset'] + e['length'] for e in self.header['entries']), default=0)
+        return _content_hash(self.header['entries'], self.header['font'], data[:end]) == self.content_hash
+
+    def info(self):
+        """Краткое описание пакета"""
+        return {
+            'path': str(self.path),
+            'bytes': len(self._mmap),
+            'render_version': self.header['render_version'],
+            'pillow': self.header['pillow'],
+            'sizes': self.header['sizes'],
+            'templates': sorted({e['template'] for e in self.header['entries']}),
+            'font': {k: v for k, v in self.header['font'].items() if k != 'metrics'},
+            'content_hash': self.content_hash,
+        }
+
+    def close(self):
+        self._mmap.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакет шаблонов для воркеров")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="собрать пакет")
+    build.add_argument('output', help="файл пакета, например templates.pack")
+    build.add_argument('--dpi', type=int, action='append',
+                       help="дополнительное разрешение (можно несколько раз: --dpi 203 --dpi 300)")
+    for name, text in (('info', "показать содержимое"), ('verify', "проверить content_hash")):
+        command = commands.add_parser(name, help=text)
+        command.add_argument('pack')
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    if args.command == 'build':
+        build_pack(LabelGenerator(), args.output, args.dpi)
+        return 0
+
+    pack = TemplatePack(args.pack)
+    try:
+        if args.command == 'info':
+            print(json.dumps(pack.info(), ensure_ascii=False, indent=2))
+            return 0
+        if pack.verify():
+            print("✅ Пакет цел")
+            return 0
+        print("❌ content_hash не совпадает")
+        return 1
+    finally:
+        pack.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
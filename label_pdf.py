@@ -0,0 +1,70 @@
+"""
+Лёгкая запись PDF для растровых этикеток herself19
+
+Одна страница, одно изображение на всю страницу. Пиксели PIL-изображения
+сжимаются Flate ровно один раз и записываются как image XObject:
+
+- 'RGB' -> DeviceRGB, 8 бит
+- 'L'   -> DeviceGray, 8 бит
+- '1'   -> DeviceGray, 1 бит (строки уже упакованы Pillow так, как ждёт PDF)
+
+В файле нет дат, идентификаторов и имени программы: одинаковое изображение
+всегда даёт одинаковые байты (удобно для кэша и сравнения).
+"""
+
+import zlib
+
+PDF_WRITER_VERSION = 1
+
+# Уровень zlib: 6 - как у reportlab по умолчанию
+COMPRESSION_LEVEL = 6
+
+_COLOR_SPACES = {
+    'RGB': (b'/DeviceRGB', 8),
+    'L': (b'/DeviceGray', 8),
+    '1': (b'/DeviceGray', 1),
+}
+
+
+def _num(value):
+    """Число для PDF без экспоненты и лишних нулей"""
+    text = f"{value:.4f}".rstrip('0').rstrip('.')
+    return (text if text not in ('', '-0') else '0').encode('ascii')
+
+
+def image_pdf(image, page_width, page_height=None, compression=COMPRESSION_LEVEL):
+    """Байты PDF: страница page_width x page_height пунктов, изображение на всю страницу"""
+    if page_height is None:
+        page_height = page_width
+    if image.mode not in _COLOR_SPACES:
+        image = image.convert('RGB')
+    color_space, bits = _COLOR_SPACES[image.mode]
+    width, height = image.size
+
+    pixels = zlib.compress(image.tobytes(), compression)
+    content = b'q ' + _num(page_width) + b' 0 0 ' + _num(page_height) + b' 0 0 cm /Im0 Do Q'
+
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 ' + _num(page_width) + b' ' + _num(page_height)
+        + b'] /Resources << /XObject << /Im0 5 0 R >> >> /Contents 4 0 R >>',
+        b'<< /Length %d >>\nstream\n' % len(content) + content + b'\nendstream',
+        b'<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace ' % (width, height)
+        + color_space + b' /BitsPerComponent %d /Filter /FlateDecode /Length %d >>\nstream\n'
+        % (bits, len(pixels)) + pixels + b'\nendstream',
+    ]
+
+    # Двоичный комментарий во второй строке - признак бинарного файла для программ передачи
+    out = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for offset in offsets:
+        out += b'%010d 00000 n \n' % offset
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(out)
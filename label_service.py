@@ -0,0 +1,354 @@
+"""
+HTTP-сервис генерации этикеток herself19 для системы заказов
+
+Эндпоинты (параметры - в query string для GET или в JSON-теле для POST):
+
+    GET       /health - состояние очереди и счётчики
+    GET|POST  /label  - одна этикетка: composition, care_type, size, color,
+                        format=pdf|png|zpl
+    GET|POST  /batch  - набор этикеток: composition, care_type, sizes, colors,
+                        format=zip|sheet|zpl, quantity (для листа A4 и ZPL)
+
+Для format=zpl: dpi=203|300|600 (по умолчанию 203) - одно задание для
+термопринтера (label_zpl.py).
+
+Значения care_type / sizes / colors - как в label_batch.py.
+
+Рендер выполняет ограниченный пул потоков. Если очередь заполнена,
+сервис сразу отвечает 429 (Retry-After). Одинаковые запросы, пришедшие
+во время рендера, не ставятся в очередь повторно, а ждут общий результат.
+
+Пример:
+    python label_service.py --port 8080 --workers 4 --queue 32
+    curl -o label.pdf "http://127.0.0.1:8080/label?composition=95%25%20Хлопок&care_type=washable&size=42&color=white"
+"""
+
+import argparse
+import io
+import json
+import logging
+import sys
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlsplit
+
+from label_batch import normalize_row
+from label_final import LabelGenerator, setup_logging
+from label_zpl import PRINTER_DPI, ZplRenderer
+
+# Максимальный размер JSON-тела запроса
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class QueueFull(Exception):
+    """Очередь рендера заполнена - клиенту нужно повторить позже"""
+
+
+class RenderService:
+    """Пул рендера с ограниченной очередью и объединением одинаковых запросов"""
+
+    def __init__(self, generator, workers=4, max_pending=32, timeout=60, batch_workers=1):
+        self.logger = logging.getLogger(__name__)
+        self.generator = generator
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.batch_workers = batch_workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='label-render')
+        self._lock = threading.Lock()
+        # Запросы в работе: {ключ: Future}
+        self._inflight = {}
+        self.counters = {'requests': 0, 'coalesced': 0, 'rejected': 0, 'rendered': 0, 'failed': 0}
+
+    def submit(self, key, fn, *args):
+        """Future результата: новый рендер или уже идущий с тем же ключом"""
+        with self._lock:
+            self.counters['requests'] += 1
+            future = self._inflight.get(key)
+            if future is not None:
+                self.counters['coalesced'] += 1
+                return future
+            if len(self._inflight) >= self.max_pending:
+                self.counters['rejected'] += 1
+                raise QueueFull(f"в очереди {len(self._inflight)} запросов")
+            future = self._inflight[key] = self.executor.submit(fn, *args)
+        # Вне блокировки: для уже завершённого Future колбэк вызывается сразу
+        future.add_done_callback(lambda done: self._finish(key, done))
+        return future
+
+    def _finish(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            self.counters['failed' if future.exception() else 'rendered'] += 1
+
+    def stats(self):
+        with self._lock:
+            result = {
+                'pending': len(self._inflight),
+                'max_pending': self.max_pending,
+                **self.counters,
+            }
+        if self.generator.warmup is not None:
+            result['warmup'] = self.generator.warmup.as_dict()
+        if self.generator.output_cache is not None:
+            result['cache'] = self.generator.output_cache.stats()
+        return result
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+    # ==================== ЗАПРОСЫ ====================
+
+    def label(self, params):
+        """Одна этикетка: (content-type, имя файла, байты)"""
+        fmt = params.get('format', 'pdf')
+        if fmt not in ('pdf', 'png', 'zpl'):
+            raise ValueError(f"неизвестный формат: '{fmt}'")
+        composition, care_type, sizes, colors, _ = normalize_row(self.generator, {
+            'composition': params.get('composition'),
+            'care_type': params.get('care_type'),
+            'sizes': params.get('size'),
+            'colors': params.get('color'),
+        })
+        if len(sizes) != 1 or len(colors) != 1:
+            raise ValueError("для /label нужен один размер (size) и один цвет (color)")
+
+        color_name = self.generator.COLORS[colors[0]]['name']
+        filename = f"{composition}_{sizes[0]}_{color_name}.{fmt}"
+        if fmt == 'zpl':
+            dpi = self._printer_dpi(params)
+            key = ('label', fmt, dpi, composition, care_type, sizes[0], colors[0])
+            future = self.submit(key, self._zpl, dpi, composition, care_type, {sizes[0]: 1}, colors)
+            return 'application/zpl', filename, self._wait(future)
+
+        key = ('label', fmt, composition, care_type, sizes[0], colors[0])
+        render = self._label_png if fmt == 'png' else self._label_pdf
+        data = self._wait(self.submit(key, render, composition, care_type, sizes[0], colors[0]))
+
+        content_type = 'image/png' if fmt == 'png' else 'application/pdf'
+        return content_type, filename, data
+
+    def batch(self, params):
+        """Набор этикеток: ZIP из отдельных PDF или лист для типографии"""
+        fmt = params.get('format', 'zip')
+        if fmt not in ('zip', 'sheet', 'zpl'):
+            raise ValueError(f"неизвестный формат: '{fmt}'")
+        composition, care_type, sizes, colors, quantity = normalize_row(self.generator, params)
+
+        if fmt == 'zpl':
+            dpi = self._printer_dpi(params)
+            key = ('batch', fmt, dpi, composition, care_type, tuple(sizes), tuple(colors), quantity)
+            future = self.submit(key, self._zpl, dpi, composition, care_type,
+                                 {size: quantity for size in sizes}, colors)
+            return 'application/zpl', f"labels_{composition}.zpl", self._wait(future)
+
+        key = ('batch', fmt, composition, care_type, tuple(sizes), tuple(colors),
+               quantity if fmt == 'sheet' else None)
+        if fmt == 'sheet':
+            future = self.submit(key, self._batch_sheet, composition, care_type, sizes, colors, quantity)
+            return 'application/pdf', f"labels_{composition}.pdf", self._wait(future)
+        future = self.submit(key, self._batch_zip, composition, care_type, sizes, colors)
+        return 'application/zip', f"labels_{composition}.zip", self._wait(future)
+
+    @staticmethod
+    def _printer_dpi(params):
+        try:
+            dpi = int(params.get('dpi') or PRINTER_DPI[0])
+        except (TypeError, ValueError):
+            dpi = None
+        if dpi not in PRINTER_DPI:
+            raise ValueError(f"dpi для ZPL: {', '.join(map(str, PRINTER_DPI))}")
+        return dpi
+
+    def _wait(self, future):
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f"рендер не завершился за {self.timeout} с")
+
+    # ==================== РЕНДЕР (потоки пула) ====================
+
+    def _label_png(self, composition, care_type, size, color):
+        g = self.generator
+        template_path = g.CARE_OPTIONS[care_type]['templates'][color]
+        label = g.create_label_image(template_path, size, composition, color, care_type=care_type)
+        if label is None:
+            raise RuntimeError("не удалось создать изображение")
+        buffer = io.BytesIO()
+        if not g.image_to_png(label, buffer):
+            raise RuntimeError("не удалось сохранить PNG")
+        return buffer.getvalue()
+
+    def _label_pdf(self, composition, care_type, size, color):
+        # Через iter_labels: учитываются BACKEND и кэш готовых PDF
+        for _, pdf_bytes in self.generator.iter_labels(composition, care_type, [size], [color], workers=1):
+            return pdf_bytes
+        raise RuntimeError("не удалось создать этикетку")
+
+    def _batch_zip(self, composition, care_type, sizes, colors):
+        zip_buffer = io.BytesIO()
+        count = 0
+        # PDF уже сжаты внутри - кладём в архив без повторного сжатия
+        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_STORED) as zip_file:
+            for filename, pdf_bytes in self.generator.iter_labels(
+                composition, care_type, sizes, colors, workers=self.batch_workers
+            ):
+                zip_file.writestr(filename, pdf_bytes)
+                count += 1
+        if count == 0:
+            raise RuntimeError("не удалось создать этикетки")
+        return zip_buffer.getvalue()
+
+    def _zpl(self, dpi, composition, care_type, quantities, colors):
+        return ZplRenderer(self.generator, dpi=dpi).job(composition, care_type, quantities, colors).encode('ascii')
+
+    def _batch_sheet(self, composition, care_type, sizes, colors, quantity):
+        buffer = io.BytesIO()
+        placed = self.generator.generate_imposed_pdf(
+            composition, care_type,
+            quantities={size: quantity for size in sizes},
+            colors=colors,
+            pdf_output_path=buffer
+        )
+        if not placed:
+            raise RuntimeError("не удалось разложить этикетки на лист")
+        return buffer.getvalue()
+
+
+class LabelRequestHandler(BaseHTTPRequestHandler):
+    """Разбор HTTP-запросов; сервис рендера - в self.server.service"""
+
+    server_version = 'herself19-labels/1.0'
+    routes = {'/label': 'label', '/batch': 'batch'}
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/health':
+            self._send_json(200, {'status': 'ok', **self.server.service.stats()})
+            return
+        params = {k: v[-1] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+        self._dispatch(url.path, params)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            if length < 0:
+                # rfile.read(-1) ждал бы закрытия соединения клиентом
+                self._send_json(400, {'error': "некорректный Content-Length"})
+                return
+            if length > MAX_BODY_BYTES:
+                self._send_json(413, {'error': "слишком большой запрос"})
+                return
+            params = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(params, dict):
+                raise ValueError("ожидается JSON-объект")
+        except ValueError as e:
+            self._send_json(400, {'error': f"некорректный JSON: {e}"})
+            return
+        self._dispatch(url.path, params)
+
+    def _dispatch(self, path, params):
+        route = self.routes.get(path)
+        if route is None:
+            self._send_json(404, {'error': f"неизвестный путь: {path}"})
+            return
+
+        service = self.server.service
+        try:
+            content_type, filename, data = getattr(service, route)(params)
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        except QueueFull as e:
+            self._send_json(429, {'error': f"сервис занят: {e}"}, {'Retry-After': '1'})
+            return
+        except TimeoutError as e:
+            self._send_json(504, {'error': str(e)})
+            return
+        except Exception as e:
+            service.logger.error("❌ Ошибка запроса %s: %s", path, e, exc_info=True)
+            self._send_json(500, {'error': str(e)})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        # Кириллица в имени файла - по RFC 5987
+        self.send_header('Content-Disposition', f"attachment; filename*=UTF-8''{quote(filename)}")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        self.server.service.logger.debug("%s - " + format, self.address_string(), *args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP-сервис генерации этикеток")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=4, help="потоков рендера")
+    parser.add_argument('--queue', type=int, default=32, help="максимум запросов в работе (дальше - 429)")
+    parser.add_argument('--timeout', type=float, default=60, help="ожидание рендера, с (дальше - 504)")
+    parser.add_argument('--batch-workers', type=int, default=1, help="процессов на один пакетный запрос")
+    parser.add_argument('--backend', choices=['raster', 'vector'], help="способ вывода текста в PDF")
+    parser.add_argument('--pdf-writer', choices=['lean', 'reportlab'], help="запись растровых PDF")
+    parser.add_argument('--color-mode', choices=['auto', 'rgb', 'gray', '1bit'], help="глубина цвета этикеток")
+    parser.add_argument('--dpi', type=int, help="разрешение растра этикетки (203 / 300 / 600)")
+    parser.add_argument('--cache-dir', help="папка постоянного кэша готовых PDF")
+    parser.add_argument('--cache-max-mb', type=int, default=512, help="лимит кэша, МБ")
+    parser.add_argument('--template-pack', help="пакет шаблонов (python label_pack.py build ...)")
+    parser.add_argument('--log-mode', choices=['detailed', 'summary'], default='summary',
+                        help="summary - одна строка лога на этикетку")
+    args = parser.parse_args(argv)
+
+    logger = setup_logging()
+    generator = LabelGenerator()
+    if args.backend:
+        generator.BACKEND = args.backend
+    if args.pdf_writer:
+        generator.PDF_WRITER = args.pdf_writer
+    if args.color_mode:
+        generator.COLOR_MODE = args.color_mode
+    if args.dpi:
+        generator.RENDER_DPI = args.dpi
+    if args.template_pack:
+        generator.use_template_pack(args.template_pack)
+    if args.cache_dir:
+        generator.enable_output_cache(args.cache_dir, max_bytes=args.cache_max_mb * 1024 * 1024)
+    generator.LOG_MODE = args.log_mode
+    # Сервер принимает запросы сразу, кэши прогреваются в фоне (см. /health)
+    generator.start_warmup()
+
+    service = RenderService(generator, workers=args.workers, max_pending=args.queue,
+                            timeout=args.timeout, batch_workers=args.batch_workers)
+    server = ThreadingHTTPServer((args.host, args.port), LabelRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+
+    logger.info(f"🌐 Сервис этикеток: http://{args.host}:{args.port} "
+                f"(потоков {args.workers}, очередь {args.queue})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Остановка сервиса")
+    finally:
+        server.server_close()
+        service.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
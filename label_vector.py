@@ -0,0 +1,235 @@
+"""
+Векторный backend для этикеток herself19
+
+Размер и состав выводятся не текстом, а контурами глифов из TTF-шрифта
+(montserrat-bold.ttf): в PDF нет текстовых слоёв, как и в растровом
+варианте, но текст остаётся чётким при любом DPI принтера.
+Шаблон встраивается один раз, уменьшенным до VECTOR_TEMPLATE_DPI (300 dpi -
+разрешение термопринтера) и в режиме label_mode ('L' для серых шаблонов),
+со сжатием Flate: исходный JPEG 1040x1040 занимал бы ~155 КБ.
+
+Каждый глиф описывается в PDF один раз (Form XObject в единицах шрифта) и
+ставится на место матрицей; путь глифа строится из fontTools один раз на
+процесс.
+
+Раскладка полностью берётся из LabelGenerator.layout_px() для рабочего
+размера - координаты в пикселях переводятся в пункты страницы FINAL_SIZE_MM.
+
+Требования: fontTools (pip install fonttools)
+"""
+
+import io
+import logging
+import threading
+
+from label_final import load_reportlab, mm
+
+try:
+    from fontTools.pens.basePen import BasePen
+    from fontTools.ttLib import TTFont
+except ImportError:
+    BasePen = object
+    TTFont = None
+
+
+class _CanvasPathPen(BasePen):
+    """Переводит контуры fontTools в путь reportlab"""
+
+    def __init__(self, glyph_set, path):
+        super().__init__(glyph_set)
+        self.path = path
+
+    def _moveTo(self, pt):
+        self.path.moveTo(*pt)
+
+    def _lineTo(self, pt):
+        self.path.lineTo(*pt)
+
+    def _curveToOne(self, pt1, pt2, pt3):
+        self.path.curveTo(*pt1, *pt2, *pt3)
+
+    def _closePath(self):
+        self.path.close()
+
+
+class GlyphOutlines:
+    """Контуры глифов одного TTF-файла"""
+
+    def __init__(self, font_path):
+        if TTFont is None:
+            raise ImportError("Для векторного режима установите: pip install fonttools")
+        self.font_path = font_path
+        # Ленивый разбор глифов fontTools не потокобезопасен: разбираем всё сразу
+        self.ttfont = TTFont(font_path, lazy=False)
+        self.ttfont.ensureDecompiled()
+        self.glyph_set = self.ttfont.getGlyphSet()
+        self.cmap = self.ttfont.getBestCmap()
+        self.units_per_em = self.ttfont['head'].unitsPerEm
+        self._paths = {}
+        self._advances = {}
+
+    def glyph_name(self, char):
+        return self.cmap.get(ord(char), '.notdef')
+
+    def glyph_path(self, char):
+        """(имя формы, путь reportlab в единицах шрифта) для символа
+
+        Путь строится один раз под _OUTLINES_LOCK, дальше потоки только
+        читают готовый код пути и не трогают объекты fontTools.
+        """
+        name = self.glyph_name(char)
+        with _OUTLINES_LOCK:
+            cached = self._paths.get(name)
+            if cached is None:
+                path = load_reportlab().canvas.pathobject.PDFPathObject()
+                self.glyph_set[name].draw(_CanvasPathPen(self.glyph_set, path))
+                cached = self._paths[name] = (f"Glyph{self.ttfont.getGlyphID(name)}", path)
+        return cached
+
+    def advances(self, pil_font, font_size, text):
+        """Смещения букв строки по Pillow (с кернингом), запоминаются"""
+        key = (font_size, text)
+        with _OUTLINES_LOCK:
+            offsets = self._advances.get(key)
+        if offsets is None:
+            offsets = [pil_font.getlength(text[:i]) for i in range(len(text))]
+            with _OUTLINES_LOCK:
+                if len(self._advances) >= 4096:
+                    self._advances.clear()
+                self._advances[key] = offsets
+        return offsets
+
+
+_OUTLINES = {}
+_OUTLINES_LOCK = threading.Lock()
+
+def get_outlines(font_path):
+    """GlyphOutlines для шрифта (разбирается один раз на процесс)"""
+    with _OUTLINES_LOCK:
+        outlines = _OUTLINES.get(font_path)
+        if outlines is None:
+            outlines = _OUTLINES[font_path] = GlyphOutlines(font_path)
+        return outlines
+
+
+class VectorLabelRenderer:
+    """Рендер этикетки в PDF: шаблон-изображение + текст контурами"""
+
+    def __init__(self, generator):
+        self.generator = generator
+        self.logger = logging.getLogger(__name__)
+
+    def _to_page(self, x, y):
+        """Пиксели рабочего размера (ось Y вниз) -> пункты PDF (ось Y вверх)"""
+        g = self.generator
+        k = g.FINAL_SIZE_MM * mm / g.WORKING_SIZE
+        return x * k, (g.WORKING_SIZE - y) * k
+
+    def _draw_text(self, c, outlines, forms, text, origin, font_size, to_label):
+        """Рисует строку контурами так же, как ImageDraw.text((x, y), text)
+
+        origin - левый верхний угол (как в Pillow, якорь 'la'), to_label -
+        преобразование координат строки в пиксели этикетки, forms - имена
+        форм глифов, уже описанных в этом PDF.
+        """
+        pil_font = self.generator.load_font(font_size)
+        ascent, _ = pil_font.getmetrics()
+        scale = font_size / outlines.units_per_em
+        x0, y0 = origin
+        baseline = y0 + ascent
+
+        fill_mode = load_reportlab().canvas.FILL_NON_ZERO
+        em = 2 * outlines.units_per_em
+        # Позиции букв берём у Pillow - совпадают с растровым вариантом
+        for char, offset in zip(text, outlines.advances(pil_font, font_size, text)):
+            if char.isspace():
+                continue
+            form, path = outlines.glyph_path(char)
+            if form not in forms:
+                # Форма наследует цвет заливки страницы
+                c.beginForm(form, -em, -em, em, em)
+                # Контуры TrueType заполняются по правилу ненулевой обмотки
+                c.drawPath(path, stroke=0, fill=1, fillMode=fill_mode)
+                c.endForm()
+                forms.add(form)
+            # Единицы шрифта (ось Y вверх) -> пиксели строки -> пиксели этикетки -> пункты
+            pen_x = x0 + offset
+            ax, ay = self._to_page(*to_label(pen_x, baseline))
+            bx, by = self._to_page(*to_label(pen_x + scale, baseline))
+            cx, cy = self._to_page(*to_label(pen_x, baseline - scale))
+            c.saveState()
+            c.transform(bx - ax, by - ay, cx - ax, cy - ay, ax, ay)
+            c.doForm(form)
+            c.restoreState()
+
+    def render_pdf(self, template_path, size, composition, color, care_type=None):
+        """Возвращает байты PDF одной этикетки"""
+        g = self.generator
+        font_path = g.font_registry.path
+        if font_path is None:
+            raise RuntimeError("Векторный режим требует TTF-шрифт, стандартный шрифт PIL не подходит")
+        outlines = get_outlines(font_path)
+        forms = set()
+
+        page_size = g.FINAL_SIZE_MM * mm
+        buffer = io.BytesIO()
+        # Через load_reportlab: те же настройки (useA85), что и у растрового PDF
+        c = load_reportlab().canvas.Canvas(buffer, pagesize=(page_size, page_size))
+        # Шаблон в разрешении принтера: декодирование и ресемплинг - из template_cache
+        template_px = g.render_size(g.VECTOR_TEMPLATE_DPI)
+        template = g.template_cache.get(template_path, template_px, care_type=care_type, color=color)
+        mode = g.label_mode(template_path, color, care_type=care_type, size_px=template_px)
+        if mode != 'RGB':
+            template = template.convert('L')
+        if mode == '1':
+            template = template.point(lambda v: 255 if v >= 128 else 0)
+        c.drawImage(g._pdf_image(template), 0, 0, width=page_size, height=page_size)
+
+        text_color = g.COLORS[color]['text_color']
+        bg_color = (255, 255, 255) if text_color == (0, 0, 0) else (0, 0, 0)
+        layout = g.layout_px(g.WORKING_SIZE)
+
+        # ==================== РАЗМЕР ====================
+        c.setFillColorRGB(*(v / 255 for v in text_color))
+        if size == 'ONE SIZE':
+            x, y = layout['size_one_size']
+            font_size = layout['font_size_small']
+            lines = [("ONE", 0), ("SIZE", layout['line_spacing_onesize'])]
+        else:
+            x, y = layout['size']
+            font_size = layout['font_size_large']
+            lines = [(size, 0)]
+        for text, dy in lines:
+            self._draw_text(c, outlines, forms, text, (x, y + dy), font_size, lambda x, y: (x, y))
+
+        # ==================== СОСТАВ ВЕРТИКАЛЬНЫЙ (90° вправо) ====================
+        comp_x, comp_y = layout['composition']
+        box_w, box_h = layout['composition_box']
+
+        # Панель после поворота: ширина box_h, высота box_w
+        left, top = self._to_page(comp_x, comp_y)
+        right, bottom = self._to_page(comp_x + box_h, comp_y + box_w)
+        c.saveState()
+        panel = c.beginPath()
+        panel.rect(left, bottom, right - left, top - bottom)
+        c.clipPath(panel, stroke=0, fill=0)
+        c.setFillColorRGB(*(v / 255 for v in bg_color))
+        c.rect(left, bottom, right - left, top - bottom, stroke=0, fill=1)
+        c.setFillColorRGB(*(v / 255 for v in text_color))
+
+        def rotate(u, v):
+            # Точка (u, v) панели до поворота -> пиксели этикетки после rotate(-90)
+            return comp_x + box_h - v, comp_y + u
+
+        font_size = layout['font_composition']
+        line_spacing = layout['line_spacing_composition']
+        padding = layout['composition_padding']
+        self._draw_text(c, outlines, forms, "СОСТАВ:", (padding, padding), font_size, rotate)
+        y_pos = padding + line_spacing
+        for material in g.parse_composition(composition):
+            self._draw_text(c, outlines, forms, material, (padding, y_pos), font_size, rotate)
+            y_pos += line_spacing
+        c.restoreState()
+
+        c.save()
+        return buffer.getvalue()
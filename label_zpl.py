@@ -0,0 +1,225 @@
+"""
+Вывод этикеток herself19 напрямую на термопринтеры (ZPL)
+
+Этикетка из create_label_image рендерится сразу в разрешении принтера
+(203 / 300 dpi), переводится в 1 бит и отправляется графикой ^GF -
+без PDF и без растеризации драйвером.
+
+Кодирование данных ^GF:
+- 'z64' - zlib + base64 с контрольной суммой CRC-16 (компактно, по умолчанию)
+- 'hex' - шестнадцатеричные байты (для старых прошивок)
+
+Одно задание может содержать много этикеток: каждая - отдельный формат
+^XA...^XZ, количество копий - ^PQ. decode_zpl() разбирает задание обратно
+в изображения для проверки без принтера.
+
+Примеры:
+    python label_zpl.py "95% Хлопок, 5% Эластан" --care washable --sizes 42 44 --quantity 10 -o job.zpl
+    python label_zpl.py --decode job.zpl --out-dir decoded
+    python label_zpl.py "95% Хлопок" --care washable --send 192.168.1.50:9100
+"""
+
+import argparse
+import base64
+import binascii
+import logging
+import re
+import socket
+import sys
+import zlib
+from pathlib import Path
+
+from PIL import Image, ImageChops
+
+from label_batch import normalize_row
+from label_final import LabelGenerator, setup_logging
+
+# Разрешения распространённых термопринтеров, dpi
+PRINTER_DPI = (203, 300, 600)
+
+
+def _crc16(data):
+    """CRC-16/CCITT (XMODEM) для блока :Z64:"""
+    return binascii.crc_hqx(data, 0)
+
+
+def to_bitmap(image):
+    """1-битное изображение для печати: порог 128 без дизеринга (как COLOR_MODE='1bit')"""
+    if image.mode == '1':
+        return image
+    return image.convert('L').point(lambda v: 255 if v >= 128 else 0).convert('1', dither=Image.Dither.NONE)
+
+
+def graphic_field(image, encoding='z64'):
+    """Команда ^GFA для 1-битного изображения"""
+    bitmap = to_bitmap(image)
+    # В ZPL 1 - точка (чёрный), в Pillow 1 - белый: инвертируем
+    data = ImageChops.invert(bitmap).tobytes()
+    row_bytes = (bitmap.width + 7) // 8
+    total = len(data)
+    if encoding == 'z64':
+        encoded = base64.b64encode(zlib.compress(data, 9))
+        payload = f":Z64:{encoded.decode('ascii')}:{_crc16(encoded):04X}"
+    elif encoding == 'hex':
+        payload = data.hex().upper()
+    else:
+        raise ValueError(f"неизвестное кодирование: '{encoding}'")
+    return f"^GFA,{total},{total},{row_bytes},{payload}"
+
+
+def label_format(image, quantity=1, encoding='z64', origin=(0, 0)):
+    """Один формат ^XA...^XZ: графика этикетки и количество копий"""
+    x, y = origin
+    return (
+        "^XA\n"
+        f"^PW{image.width + x}\n"
+        f"^LL{image.height + y}\n"
+        "^LH0,0\n"
+        f"^FO{x},{y}{graphic_field(image, encoding)}^FS\n"
+        f"^PQ{quantity}\n"
+        "^XZ\n"
+    )
+
+
+class ZplRenderer:
+    """Задания ZPL из этикеток LabelGenerator"""
+
+    def __init__(self, generator, dpi=203, encoding='z64'):
+        self.logger = logging.getLogger(__name__)
+        # Растр сразу в разрешении принтера и в 1 бит - той же раскладкой, что PDF
+        self.generator = generator.with_options(RENDER_DPI=dpi, COLOR_MODE='1bit')
+        self.dpi = dpi
+        self.encoding = encoding
+
+    def label(self, composition, care_type, size, color, quantity=1):
+        """ZPL одной этикетки"""
+        g = self.generator
+        template_path = g.CARE_OPTIONS[care_type]['templates'].get(color)
+        if not template_path:
+            raise ValueError(f"шаблон для цвета '{color}' не найден")
+        image = g.create_label_image(template_path, size, composition, color, care_type=care_type)
+        if image is None:
+            raise RuntimeError(f"не удалось создать этикетку {size} / {color}")
+        return label_format(image, quantity, self.encoding)
+
+    def job(self, composition, care_type, quantities=None, colors=None):
+        """Одно задание на все размеры и цвета: quantities - {размер: количество}"""
+        g = self.generator
+        if quantities is None:
+            quantities = {size: 1 for size in g.SIZES}
+        elif isinstance(quantities, int):
+            quantities = {size: quantities for size in g.SIZES}
+        if colors is None:
+            colors = list(g.COLORS.keys())
+
+        formats = []
+        for size, quantity in quantities.items():
+            if quantity <= 0:
+                continue
+            for color in colors:
+                formats.append(self.label(composition, care_type, size, color, quantity))
+        copies = sum(quantity for quantity in quantities.values() if quantity > 0) * len(colors)
+        self.logger.info(f"🖨️ ZPL: {len(formats)} этикеток, {copies} копий, {self.dpi} dpi")
+        return ''.join(formats)
+
+
+# ==================== ПРОВЕРКА ====================
+
+_FORMAT_RE = re.compile(r'\^XA(.*?)\^XZ', re.S)
+_GF_RE = re.compile(r'\^FO(\d+),(\d+)\^GFA,(\d+),(\d+),(\d+),([^\^]*)', re.S)
+
+
+def _decode_payload(payload, total):
+    payload = payload.strip()
+    if payload.startswith(':Z64:'):
+        encoded, _, crc = payload[5:].partition(':')
+        encoded = encoded.encode('ascii')
+        if crc and int(crc, 16) != _crc16(encoded):
+            raise ValueError("CRC блока Z64 не совпадает")
+        data = zlib.decompress(base64.b64decode(encoded))
+    else:
+        data = bytes.fromhex(''.join(payload.split()))
+    if len(data) != total:
+        raise ValueError(f"ожидалось {total} байт графики, получено {len(data)}")
+    return data
+
+
+def decode_zpl(text):
+    """Разбирает задание: список (изображение '1', количество копий)"""
+    labels = []
+    for body in _FORMAT_RE.findall(text):
+        width = int(re.search(r'\^PW(\d+)', body).group(1))
+        height = int(re.search(r'\^LL(\d+)', body).group(1))
+        quantity = re.search(r'\^PQ(\d+)', body)
+        page = Image.new('1', (width, height), 1)
+        for x, y, total, _, row_bytes, payload in _GF_RE.findall(body):
+            data = _decode_payload(payload, int(total))
+            row_bytes = int(row_bytes)
+            graphic = Image.frombytes('1', (row_bytes * 8, len(data) // row_bytes), data)
+            page.paste(ImageChops.invert(graphic), (int(x), int(y)))
+        labels.append((page, int(quantity.group(1)) if quantity else 1))
+    return labels
+
+
+def send_to_printer(data, address, timeout=30):
+    """Отправляет задание на сетевой принтер (RAW, обычно порт 9100)"""
+    host, _, port = address.partition(':')
+    with socket.create_connection((host, int(port or 9100)), timeout=timeout) as connection:
+        connection.sendall(data.encode('ascii'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Этикетки в ZPL для термопринтеров")
+    parser.add_argument('composition', nargs='?', help="состав, например '95%% Хлопок, 5%% Эластан'")
+    parser.add_argument('--care', default='washable', help="washable / not_washable")
+    parser.add_argument('--sizes', nargs='+', help="размеры (по умолчанию - все)")
+    parser.add_argument('--colors', nargs='+', help="white / black (по умолчанию - оба)")
+    parser.add_argument('--quantity', type=int, default=1, help="копий каждой этикетки")
+    parser.add_argument('--dpi', type=int, choices=PRINTER_DPI, default=203, help="разрешение принтера")
+    parser.add_argument('--encoding', choices=['z64', 'hex'], default='z64')
+    parser.add_argument('-o', '--output', help="файл задания (.zpl)")
+    parser.add_argument('--send', metavar='HOST[:PORT]', help="отправить на сетевой принтер")
+    parser.add_argument('--decode', metavar='ZPL', help="разобрать задание обратно в PNG")
+    parser.add_argument('--out-dir', default='zpl_decoded', help="папка для PNG при --decode")
+    args = parser.parse_args(argv)
+
+    # Задание в stdout - лог в консоль только через stderr, иначе он смешается с ZPL
+    job_to_stdout = not args.decode and not args.output and not args.send
+    setup_logging(console=sys.stderr if job_to_stdout else None)
+    if args.decode:
+        out_dir = Path(args.out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        labels = decode_zpl(Path(args.decode).read_text(encoding='ascii'))
+        for i, (image, quantity) in enumerate(labels, start=1):
+            image.save(out_dir / f"label_{i:03d}_x{quantity}.png")
+        print(f"✅ Разобрано этикеток: {len(labels)} -> {out_dir}")
+        return 0
+
+    if not args.composition:
+        parser.error("укажите состав или --decode")
+    generator = LabelGenerator()
+    # Те же проверки и синонимы, что у пакетной генерации и сервиса
+    try:
+        composition, care_type, sizes, colors, quantity = normalize_row(generator, {
+            'composition': args.composition,
+            'care_type': args.care,
+            'sizes': args.sizes,
+            'colors': args.colors,
+            'quantity': args.quantity,
+        })
+    except ValueError as e:
+        parser.error(str(e))
+    renderer = ZplRenderer(generator, dpi=args.dpi, encoding=args.encoding)
+    job = renderer.job(composition, care_type, {size: quantity for size in sizes}, colors)
+
+    if args.output:
+        Path(args.output).write_text(job, encoding='ascii')
+    if args.send:
+        send_to_printer(job, args.send)
+    if not args.output and not args.send:
+        sys.stdout.write(job)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
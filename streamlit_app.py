@@ -1,11 +1,12 @@
 import streamlit as st
 import zipfile
 import io
-import tempfile
-from pathlib import Path
 import os
 
-from label_final import LabelGenerator, setup_logging
+from label_final import AdmissionQueue, LabelGenerator, setup_logging
+
+# Сколько генераций идёт одновременно (остальные сессии ждут в очереди)
+MAX_ACTIVE_GENERATIONS = os.cpu_count() or 1
 
 st.set_page_config(
     page_title="Генератор этикеток HERSELF19",
@@ -19,9 +20,20 @@ st.markdown("---")
 @st.cache_resource
 def get_generator():
     setup_logging()
-    return LabelGenerator()
+    generator = LabelGenerator()
+    # Повторные нажатия с теми же параметрами отдаются из кэша без рендера
+    generator.enable_output_cache()
+    # Шаблоны и шрифты грузятся в фоне, страница открывается сразу
+    generator.start_warmup()
+    return generator
 generator = get_generator()
 
+@st.cache_resource
+def get_admission_queue():
+    # Одна очередь на все сессии сервера
+    return AdmissionQueue(MAX_ACTIVE_GENERATIONS)
+admission = get_admission_queue()
+
 # ----- Ввод данных -----
 st.markdown("### 📝 Состав материалов")
 composition = st.text_area(
@@ -61,6 +73,33 @@ if color_mode == "both":
 else:
     colors = [color_mode]
 
+st.markdown("### 📦 Формат результата")
+output_mode = st.radio(
+    "Выберите формат:",
+    options=["zip", "sheet"],
+    format_func=lambda v: "Отдельные PDF (ZIP)" if v == "zip" else "Лист A4 для типографии",
+    horizontal=True
+)
+if output_mode == "sheet":
+    quantity = st.number_input("Количество каждой этикетки:", min_value=1, value=1, step=1)
+
+# ----- Предпросмотр -----
+@st.cache_data(max_entries=256, show_spinner=False)
+def render_preview(composition, care_type, size, color):
+    # Тот же рендер, что и у PDF, только в низком разрешении
+    return generator.preview_png(composition, care_type, size, color)
+
+if composition and sizes and colors:
+    st.markdown("### 👀 Предпросмотр")
+    preview_size = st.selectbox("Размер для предпросмотра:", options=sizes)
+    columns = st.columns(len(colors))
+    for column, color in zip(columns, colors):
+        preview = render_preview(composition, care_type, preview_size, color)
+        if preview:
+            column.image(preview, caption=generator.COLORS[color]["name"])
+        else:
+            column.warning("Предпросмотр недоступен")
+
 st.info("Этикетки создаются в виде PDF-файлов на основе PNG-изображения — печать будет без ошибок текста!")
 
 # ----- Кнопка генерации -----
@@ -69,28 +108,61 @@ if st.button("🚀 Сгенерировать этикетки", type="primary",
     if not composition or not sizes or not colors:
         st.error("Пожалуйста, заполните все параметры!")
     else:
-        with st.spinner("Создаём этикетки..."):
-            with tempfile.TemporaryDirectory() as temp_dir:
-                original_output = generator.output_dir
-                generator.output_dir = Path(temp_dir) / "output"
-                generator.output_dir.mkdir(exist_ok=True)
-
-                count = generator.generate_all_labels(
-                    composition=composition,
-                    care_type=care_type,
-                    sizes=sizes,
-                    colors=colors
-                )
+        # Генератор общий для всех сессий: параметры и результат передаются
+        # в каждый вызов, общие настройки не меняются
+        queue_status = st.empty()
+        
+        def on_wait(position):
+            queue_status.info(f"⏳ Сервер занят, вы в очереди: {position}")
+        
+        with admission.admit(on_wait=on_wait):
+            queue_status.empty()
+            if output_mode == "sheet":
+                with st.spinner("Раскладываем этикетки на листы..."):
+                    pdf_buffer = io.BytesIO()
+                    count = generator.generate_imposed_pdf(
+                        composition=composition,
+                        care_type=care_type,
+                        quantities={size: int(quantity) for size in sizes},
+                        colors=colors,
+                        pdf_output_path=pdf_buffer
+                    )
+                if count > 0:
+                    st.success(f"Размещено {count} этикеток!")
+                    st.download_button(
+                        label="📥 Скачать лист для печати (PDF)",
+                        data=pdf_buffer.getvalue(),
+                        file_name=f"labels_{composition.replace('/', '_')}.pdf",
+                        mime="application/pdf",
+                        use_container_width=True
+                    )
+                else:
+                    st.error("Не удалось создать этикетки. Проверьте исходные файлы-шаблоны.")
+            else:
+                total = len(sizes) * len(colors)
+                progress = st.progress(0.0, text=f"Создаём этикетки: 0 из {total}")
+                
+                def on_progress(done, total):
+                    progress.progress(done / total, text=f"Создаём этикетки: {done} из {total}")
+                
+                # PDF уже сжаты внутри - кладём в архив без повторного сжатия
+                zip_buffer = io.BytesIO()
+                count = 0
+                with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_STORED) as zip_file:
+                    for filename, pdf_bytes in generator.iter_labels(
+                        composition=composition,
+                        care_type=care_type,
+                        sizes=sizes,
+                        colors=colors,
+                        workers=1,
+                        on_progress=on_progress
+                    ):
+                        zip_file.writestr(filename, pdf_bytes)
+                        count += 1
+                zip_buffer.seek(0)
+                progress.empty()
                 
-                folder = generator.output_dir / composition
-                if folder.exists() and count > 0:
-                    zip_buffer = io.BytesIO()
-                    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-                        # Сохраняем только PDF-файлы (PNG временные, они очищаются)
-                        for file_path in folder.glob("*.pdf"):
-                            zip_file.write(file_path, file_path.name)
-                    zip_buffer.seek(0)
-                    generator.output_dir = original_output
+                if count > 0:
                     st.success(f"Создано {count} этикеток!")
                     st.download_button(
                         label="📥 Скачать этикетки (ZIP)",